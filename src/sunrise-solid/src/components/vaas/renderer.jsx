@@ -108,6 +108,15 @@ export default class Renderer {
     /** @type {Number} */
     path_index = 0;
 
+    /** @type {String} */
+    session = Math.random().toString(36).slice(2);
+
+    /** @type {Number} */
+    sequence = 0;
+
+    /** @type {?String} The priority animations ask the server to render their frames with */
+    priority = null;
+
     /**
         * @param {HTML.Element} primary The primary canvas to render the final image to
         * @param {Number} width The total width of the canvas
@@ -250,8 +259,9 @@ export default class Renderer {
     /**
         * @description Make a rendering request for a tile
         * @param {Tile} tile The tile we are trying to render
+        * @param {Number} sequence The sequence number of the frame the tile belongs to
     */
-    #tile_request(tile) {
+    #tile_request(tile, sequence) {
         this.current_direction = this.controls.dir();
         const px = this.camera.position.x * this.camera_scaling_factor;
         const py = this.camera.position.y * this.camera_scaling_factor;
@@ -286,6 +296,11 @@ export default class Renderer {
         url.searchParams.append('light', this.current_light);
         //url.searchParams.append('observation', species());
         url.searchParams.append('observation', this.current_species);
+        url.searchParams.append('session', this.session);
+        url.searchParams.append('sequence', sequence);
+        if (this.priority !== null) {
+            url.searchParams.append('priority', this.priority);
+        }
 
         // Make the request
         return new Promise((res, rej) => {
@@ -309,6 +324,7 @@ export default class Renderer {
         const start = this.current_time;
         const end = this.current_time + 24;
 
+        this.priority = 'animation';
         while (this.current_time <= end) {
             await new Promise((res) => {
                 this.current_time += step;
@@ -318,6 +334,7 @@ export default class Renderer {
             });
         }
         this.current_time = start;
+        this.priority = null;
     }
 
     /**
@@ -577,6 +594,8 @@ export default class Renderer {
         const tile_width = this.width / this.colCountCurrent;
         const tile_height = this.height / this.rowCountCurrent;
         let promises = [];
+        // Newer frames let the server cancel tiles of older ones
+        const sequence = ++this.sequence;
 
         for (let i = 0; i < this.tile_definitions.length; i++) {
             promises.push((() => {
@@ -586,7 +605,7 @@ export default class Renderer {
                 let y = (row / this.rowCountCurrent) * this.height;
                 let x = (col / this.colCountCurrent) * this.width;
 
-                return this.#tile_request(this.tile_definitions[i]).then((image) => {
+                return this.#tile_request(this.tile_definitions[i], sequence).then((image) => {
                     ctx.drawImage(image, x, y, tile_width, tile_height);
                 });
             })());
@@ -0,0 +1,157 @@
+"""
+
+"""
+
+from __future__ import annotations
+from ._auto import auto
+
+import collections
+import concurrent.futures
+import pathlib
+import resource
+import threading
+import time
+
+__all__ = [
+    'registry',
+    'Assets',
+    'measure',
+]
+
+
+# Page faults are counted per loading thread where the platform allows it
+RUSAGE = getattr(resource, 'RUSAGE_THREAD', resource.RUSAGE_SELF)
+
+
+def measure(asset, /) -> dict:
+    """Make an asset and report what loading it cost: the bytes of its
+    files, wall time and the page faults taken by the loading thread."""
+    before = resource.getrusage(RUSAGE)
+    start = time.perf_counter_ns()
+    asset.make()
+    wall = time.perf_counter_ns() - start
+    after = resource.getrusage(RUSAGE)
+
+    path = auto.pathlib.Path(asset.path)
+    if path.is_dir():
+        nbytes = sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+    else:
+        nbytes = path.stat().st_size
+
+    return dict(
+        asset=type(asset).__name__,
+        path=str(path),
+        bytes=nbytes,
+        time=wall,
+        minor_faults=after.ru_minflt - before.ru_minflt,
+        major_faults=after.ru_majflt - before.ru_majflt,
+    )
+
+
+class Assets:
+    """Read-only scene assets shared by every Scene of the process.
+
+    Terrains, colormaps, observations and HDRIs are loaded (memmapped,
+    wrapped in OSPData and committed) once per (class, path). Every Park
+    and Scene that asks for the same asset gets the same object back, and
+    the asset is closed when the last of them releases it.
+
+    Every load is measured and counted in the totals of stats(); the last
+    `history` loads are kept in `report`, so startup cost can be logged
+    per asset.
+    """
+
+    def __init__(self, *, history: int=256):
+        self._assets: dict[tuple[type, pathlib.Path], list] = {}
+        self._keys: dict[int, tuple[type, pathlib.Path]] = {}
+        self._lock = threading.Lock()
+
+        self.report: collections.deque[dict] = collections.deque(maxlen=history)
+        self.loads = 0
+        self.acquires = 0
+        self.bytes = 0
+        self.time = 0
+
+    def __len__(self) -> int:
+        return len(self._assets)
+
+    # Load an asset that is not loaded yet, unreferenced
+    def _load(self, key: tuple[type, pathlib.Path]):
+        cls, path = key
+        asset = cls(path=path)
+        row = measure(asset)
+
+        with self._lock:
+            if key in self._assets:
+                # Another thread loaded it first
+                asset.close()
+                return
+
+            self._assets[key] = [asset, 0]
+            self._keys[id(asset)] = key
+            self.report.append(row)
+            self.loads += 1
+            self.bytes += row['bytes']
+            self.time += row['time']
+
+    def acquire(self, cls: type, path: pathlib.Path, /):
+        key = (cls, auto.pathlib.Path(path))
+        with self._lock:
+            entry = self._assets.get(key)
+
+        if entry is None:
+            self._load(key)
+
+        with self._lock:
+            entry = self._assets[key]
+            entry[1] += 1
+            self.acquires += 1
+            return entry[0]
+
+    def acquire_all(
+        self,
+        specs: list[tuple[type, pathlib.Path]],
+        /,
+        *,
+        workers: int | None=None,
+    ) -> list:
+        """Acquire several assets, loading the missing ones concurrently.
+
+        Reading memmaps and copying into OSPRay release the GIL, so a
+        thread per asset overlaps their I/O.
+        """
+        keys = [(cls, auto.pathlib.Path(path)) for cls, path in specs]
+        with self._lock:
+            missing = [key for key in dict.fromkeys(keys) if key not in self._assets]
+
+        if len(missing) > 1 and workers != 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                for _ in executor.map(self._load, missing):
+                    pass
+
+        return [self.acquire(cls, path) for cls, path in keys]
+
+    def release(self, asset, /):
+        with self._lock:
+            key = self._keys[id(asset)]
+            entry = self._assets[key]
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+
+            del self._assets[key]
+            del self._keys[id(asset)]
+
+        asset.close()
+
+    def stats(self) -> dict:
+        return dict(
+            assets=len(self._assets),
+            loads=self.loads,
+            acquires=self.acquires,
+            bytes=self.bytes,
+            time=self.time,
+        )
+
+
+registry = Assets()
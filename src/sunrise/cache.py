@@ -0,0 +1,110 @@
+"""
+
+"""
+
+from __future__ import annotations
+from ._auto import auto
+
+import collections
+import dataclasses
+import hashlib
+import json
+
+__all__ = [
+    'Entry',
+    'TileCache',
+]
+
+
+@dataclasses.dataclass
+class Entry:
+    content: bytes
+    media_type: str
+    etag: str
+    headers: dict[str, str]
+
+
+class TileCache:
+    """Encoded tiles by a canonical hash of the request that rendered them.
+
+    Camera vectors are rounded to `position_digits` decimals and the hour to
+    `hour_digits` before hashing, so requests that differ only by float
+    noise share an entry. Entries are evicted least recently used first
+    once together they hold more than `capacity` bytes.
+    """
+
+    def __init__(self, capacity: int, *, position_digits: int, hour_digits: int):
+        self.capacity = capacity
+        self.position_digits = position_digits
+        self.hour_digits = hour_digits
+
+        self._entries: collections.OrderedDict[str, Entry] = collections.OrderedDict()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, request, /, *extra) -> str:
+        fields = dataclasses.asdict(request)
+        for name in ('position', 'direction', 'up'):
+            fields[name] = [round(x, self.position_digits) + 0.0 for x in fields[name]]
+        fields['hour'] = round(fields['hour'], self.hour_digits) + 0.0
+        fields['extra'] = list(extra)
+
+        canonical = json.dumps(fields, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key: str, /) -> Entry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, content: bytes, *, media_type: str, headers: dict[str, str]) -> Entry:
+        # A strong validator: it changes whenever the bytes do
+        etag = '"{}"'.format(hashlib.sha256(content).hexdigest()[:32])
+        entry = Entry(
+            content=content,
+            media_type=media_type,
+            etag=etag,
+            headers=headers,
+        )
+        if len(content) > self.capacity:
+            return entry
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= len(previous.content)
+
+        self._entries[key] = entry
+        self.bytes += len(content)
+        while self.bytes > self.capacity:
+            _key, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted.content)
+            self.evictions += 1
+
+        return entry
+
+    def stats(self) -> dict:
+        return dict(
+            entries=len(self._entries),
+            bytes=self.bytes,
+            capacity=self.capacity,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+# Whether an If-None-Match header matches an ETag
+def matches(if_none_match: str | None, etag: str, /) -> bool:
+    if if_none_match is None:
+        return False
+
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
@@ -0,0 +1,220 @@
+"""
+
+"""
+
+from __future__ import annotations
+from ._auto import auto
+
+import asyncio
+import dataclasses
+import typing
+
+__all__ = [
+    'FrameCoalescer',
+]
+
+
+class Batch:
+    def __init__(self, request):
+        self.request = request
+        self.tiles: dict[tuple[int, int], list[asyncio.Future]] = {}
+        self.owners: dict[asyncio.Future, typing.Hashable] = {}
+        self.handle: asyncio.TimerHandle | None = None
+        self.task: asyncio.Task | None = None
+
+    def waiting(self) -> dict[tuple[int, int], list[asyncio.Future]]:
+        return {
+            cell: futures
+            for cell, futures in self.tiles.items()
+            if any(not future.done() for future in futures)
+        }
+
+    # Who asked for the tiles still waited for, once per request
+    def waiting_owners(self, tiles: dict[tuple[int, int], list[asyncio.Future]]) -> list:
+        return [
+            self.owners[future]
+            for futures in tiles.values()
+            for future in futures
+            if not future.done()
+        ]
+
+    # Stop rendering once every tile of the batch has been given up on
+    def abandon(self, future: asyncio.Future):
+        if not future.cancelled():
+            return
+
+        if self.task is not None and not self.task.done() and not self.waiting():
+            self.task.cancel()
+
+
+class FrameCoalescer:
+    """Render sibling tiles of one view, requested together, as one frame.
+
+    Tiles whose requests only differ by `tile` and that arrive within
+    `window` seconds of the first one are rendered as a single frame that
+    spans them all (see RenderingRequest.span); each request then gets its
+    own tile sliced out of that frame. Besides the per-frame setup, this
+    saves tracing a ghost border around every tile, since only the outer
+    border of the frame needs one. A batch is rendered early once every
+    tile of the view has arrived. It falls back to one frame per tile when
+    spanning the tiles would take more than `max_tiles` tiles, or more than
+    twice as many tiles as were asked for.
+
+    `render` is called with the frame and the owners of the requests it
+    is rendered for, one per request, so the cost of a shared frame can be
+    split between them.
+    """
+
+    def __init__(self, *, window: float, max_tiles: int):
+        self.window = window
+        self.max_tiles = max_tiles
+
+        self._batches: dict[tuple, Batch] = {}
+
+        self.frames = 0
+        self.coalesced = 0
+
+    async def submit(
+        self,
+        request,
+        render: typing.Callable[[typing.Any, list], typing.Awaitable],
+        /,
+        *,
+        owner: typing.Hashable=None,
+    ):
+        if self.window <= 0 or request.span != (1, 1):
+            return await render(request, [owner])
+
+        row, col = request.tile
+        row_id, rows = map(int, row.split('of'))
+        col_id, cols = map(int, col.split('of'))
+
+        key = dataclasses.astuple(dataclasses.replace(
+            request,
+            tile=(f'*of{rows}', f'*of{cols}'),
+        ))
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = Batch(request)
+            batch.handle = auto.asyncio.get_running_loop().call_later(
+                self.window, self._flush, key, batch, render,
+            )
+
+        future = auto.asyncio.get_running_loop().create_future()
+        future.add_done_callback(batch.abandon)
+        batch.owners[future] = owner
+        batch.tiles.setdefault((row_id, col_id), []).append(future)
+        if len(batch.tiles) == rows * cols:
+            self._flush(key, batch, render)
+
+        return await future
+
+    def _flush(self, key: tuple, batch: Batch, render):
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+        batch.handle.cancel()
+        if batch.task is None:
+            batch.task = auto.asyncio.ensure_future(self._render(batch, render))
+
+    async def _render(self, batch: Batch, render):
+        waiting = batch.waiting()
+        if not waiting:
+            return
+
+        request = batch.request
+        row, col = request.tile
+        _, rows = map(int, row.split('of'))
+        _, cols = map(int, col.split('of'))
+
+        row_lo = min(row_id for row_id, _ in waiting)
+        row_hi = max(row_id for row_id, _ in waiting)
+        col_lo = min(col_id for _, col_id in waiting)
+        col_hi = max(col_id for _, col_id in waiting)
+        span = (row_hi - row_lo + 1, col_hi - col_lo + 1)
+
+        owners = batch.waiting_owners(waiting)
+        if not owners:
+            return
+
+        area = span[0] * span[1]
+        if len(waiting) == 1 or area > self.max_tiles or 2 * len(waiting) < area:
+            await auto.asyncio.gather(*(
+                self._render_one(batch, cell, futures, render)
+                for cell, futures in waiting.items()
+            ))
+            return
+
+        frame = dataclasses.replace(
+            request,
+            tile=(f'{row_lo}of{rows}', f'{col_lo}of{cols}'),
+            span=span,
+        )
+        self.frames += 1
+        self.coalesced += len(waiting)
+        try:
+            response = await render(frame, owners)
+
+        except asyncio.CancelledError as e:
+            settle(waiting, exception=e)
+            raise
+
+        except Exception as e:
+            settle(waiting, exception=e)
+            return
+
+        settle(waiting, result=lambda row_id, col_id: response.tile(
+            row_id - row_lo,
+            col_id - col_lo,
+            width=request.width,
+            height=request.height,
+        ))
+
+    async def _render_one(self, batch: Batch, cell: tuple[int, int], futures: list, render):
+        row, col = batch.request.tile
+        _, rows = map(int, row.split('of'))
+        _, cols = map(int, col.split('of'))
+        request = dataclasses.replace(
+            batch.request,
+            tile=(f'{cell[0]}of{rows}', f'{cell[1]}of{cols}'),
+        )
+
+        # Every request for this tile may have been given up on before we
+        # got to it
+        owners = batch.waiting_owners({cell: futures})
+        if not owners:
+            return
+
+        try:
+            response = await render(request, owners)
+
+        except asyncio.CancelledError as e:
+            settle({cell: futures}, exception=e)
+            raise
+
+        except Exception as e:
+            settle({cell: futures}, exception=e)
+            return
+
+        settle({cell: futures}, result=lambda row_id, col_id: response)
+
+    def stats(self) -> dict:
+        return dict(
+            batches=len(self._batches),
+            frames=self.frames,
+            coalesced=self.coalesced,
+        )
+
+
+# Resolve the futures of each tile with result(row, col), or fail them all
+def settle(tiles: dict[tuple[int, int], list[asyncio.Future]], *, result=None, exception=None):
+    for (row_id, col_id), futures in tiles.items():
+        for future in futures:
+            if future.done():
+                continue
+
+            if isinstance(exception, asyncio.CancelledError):
+                future.cancel()
+            elif exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result(row_id, col_id))
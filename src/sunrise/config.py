@@ -12,6 +12,15 @@ class RendererConfig:
         self._type = self.data["type"]
         self._modules = self.data["modules"]
         self._samples = self.data["samples"]
+        self._workers = self.data.get("workers", 6)
+        self._queue = self.data.get("queue", 64)
+        self._retry_after = self.data.get("retry_after", 1)
+        self._max_passes = self.data.get("max_passes", 64)
+        self._framebuffer_bytes = self.data.get("framebuffer_bytes", 256 * 2**20)
+        self._coalesce_window = self.data.get("coalesce_window", 0.005)
+        self._coalesce_tiles = self.data.get("coalesce_tiles", 64)
+        self._aging = self.data.get("aging", 0.5)
+        self._interactive_pixels = self.data.get("interactive_pixels", 256 * 256 * 2)
 
         # Valid types that we allow for the renderer
         self._valid_types = [
@@ -36,6 +45,9 @@ class RendererConfig:
                 if module not in self._valid_modules:
                     print(f'ERROR: Invalid module: ${module}')
                     exit()
+        if self._workers < 1:
+            print(f'ERROR: Invalid number of workers: {self._workers}')
+            exit()
         print("success")
 
     # Get the type of renderer from the config
@@ -50,6 +62,242 @@ class RendererConfig:
     def samples(self):
         return self._samples
 
+    # Get the number of Scenes that render concurrently
+    def workers(self):
+        return self._workers
+
+    # Get how many requests may wait for a Scene before we answer 503
+    def queue(self):
+        return self._queue
+
+    # Get the number of seconds clients are told to wait after a 503
+    def retry_after(self):
+        return self._retry_after
+
+    # Get the most accumulation passes a single request may ask for
+    def max_passes(self):
+        return self._max_passes
+
+    # Get how many bytes of idle framebuffers each Scene may keep for reuse
+    def framebuffer_bytes(self):
+        return self._framebuffer_bytes
+
+    # Get how many seconds sibling tiles of one view wait for each other to
+    # be rendered as one frame, 0 to render every tile on its own
+    def coalesce_window(self):
+        return self._coalesce_window
+
+    # Get the most tiles a coalesced frame may span
+    def coalesce_tiles(self):
+        return self._coalesce_tiles
+
+    # Get how many seconds of waiting for a Scene make up for one level of
+    # priority, so lower priority renders are not starved
+    def aging(self):
+        return self._aging
+
+    # Get the most pixel samples (width * height * samples) of a render
+    # that is treated as interactive when no priority is given
+    def interactive_pixels(self):
+        return self._interactive_pixels
+
+class LightsConfig:
+    def __init__(self, lights_data):
+        self.data = lights_data
+
+        self._cache = self.data.get("cache", 64)
+        self._hour_resolution = self.data.get("hour_resolution", 60)
+        self._sky_digits = self.data.get("sky_digits", 2)
+
+    def validate(self):
+        print("Validating lights...", end=" ")
+        if self._cache < 2:
+            print(f'ERROR: The light cache needs room for at least 2 lights but got {self._cache}')
+            exit()
+        print("success")
+
+    # Get how many sun lights each Scene keeps committed
+    def cache(self):
+        return self._cache
+
+    # Get how many distinct sun positions there are per hour
+    def hour_resolution(self):
+        return self._hour_resolution
+
+    # Get how many decimals of the normalized sky vector tell lights apart
+    def sky_digits(self):
+        return self._sky_digits
+
+class ParkConfig:
+    def __init__(self, park_data):
+        self.data = park_data
+
+        self._models = self.data.get("models", 8)
+        self._observation_bytes = self.data.get("observation_bytes", 256 * 2**20)
+        self._loaders = self.data.get("loaders", None)
+
+    def validate(self):
+        print("Validating park...", end=" ")
+        if self._models < 1:
+            print(f'ERROR: The park needs room for at least 1 observation model but got {self._models}')
+            exit()
+        print("success")
+
+    # Get how many committed observation models each Park keeps, each
+    # costs about one copy of the terrain BVH
+    def models(self):
+        return self._models
+
+    # Get how many bytes of observations the process keeps loaded
+    def observation_bytes(self):
+        return self._observation_bytes
+
+    # Get how many threads load assets at startup, None for one per CPU
+    def loaders(self):
+        return self._loaders
+
+class CacheConfig:
+    def __init__(self, cache_data):
+        self.data = cache_data
+
+        self._bytes = self.data.get("bytes", 64 * 2**20)
+        self._position_digits = self.data.get("position_digits", 3)
+        self._hour_digits = self.data.get("hour_digits", 2)
+
+    def validate(self):
+        print("Validating cache...", end=" ")
+        if self._bytes < 0:
+            print(f'ERROR: The tile cache size cannot be negative but got {self._bytes}')
+            exit()
+        print("success")
+
+    # Get how many bytes of encoded tiles are kept for repeated views
+    def bytes(self):
+        return self._bytes
+
+    # Get how many decimals of the camera vectors tell cached tiles apart
+    def position_digits(self):
+        return self._position_digits
+
+    # Get how many decimals of the hour tell cached tiles apart
+    def hour_digits(self):
+        return self._hour_digits
+
+class EncodingConfig:
+    def __init__(self, encoding_data):
+        self.data = encoding_data
+
+        self._png_level = self.data.get("png_level", 6)
+        self._png_alpha = self.data.get("png_alpha", False)
+        self._jpeg_quality = self.data.get("jpeg_quality", 85)
+        self._webp_quality = self.data.get("webp_quality", 80)
+        self._webp_lossless = self.data.get("webp_lossless", False)
+        self._raw_level = self.data.get("raw_level", 1)
+        self._workers = self.data.get("workers", 2)
+
+    def validate(self):
+        print("Validating encoding...", end=" ")
+        if not 0 <= self._png_level <= 9:
+            print(f'ERROR: The PNG compression level needs to be between 0 and 9 but got {self._png_level}')
+            exit()
+        for name, quality in [("jpeg", self._jpeg_quality), ("webp", self._webp_quality)]:
+            if not 0 <= quality <= 100:
+                print(f'ERROR: The {name} quality needs to be between 0 and 100 but got {quality}')
+                exit()
+        if self._workers < 0:
+            print(f'ERROR: Invalid number of encoding workers: {self._workers}')
+            exit()
+        print("success")
+
+    # Get the zlib compression level of PNG images
+    def png_level(self):
+        return self._png_level
+
+    # Get whether PNG images keep their alpha channel
+    def png_alpha(self):
+        return self._png_alpha
+
+    # Get the quality of JPEG images
+    def jpeg_quality(self):
+        return self._jpeg_quality
+
+    # Get the quality of lossy WebP images
+    def webp_quality(self):
+        return self._webp_quality
+
+    # Get whether WebP images are lossless
+    def webp_lossless(self):
+        return self._webp_lossless
+
+    # Get the zlib level of raw responses that ask to be compressed
+    def raw_level(self):
+        return self._raw_level
+
+    # Get the number of processes that encode images, 0 to encode on a thread
+    def workers(self):
+        return self._workers
+
+class FairnessConfig:
+    def __init__(self, fairness_data):
+        self.data = fairness_data
+
+        self._seconds = self.data.get("seconds", 2.0)
+        self._window = self.data.get("window", 1.0)
+
+    def validate(self):
+        print("Validating fairness...", end=" ")
+        if self._seconds < 0:
+            print(f'ERROR: The render seconds per client cannot be negative but got {self._seconds}')
+            exit()
+        if self._window <= 0:
+            print(f'ERROR: The fairness window needs to be positive but got {self._window}')
+            exit()
+        print("success")
+
+    # Get how many seconds of rendering each client may use per window
+    # before its renders wait behind everyone else's, 0 for no limit
+    def seconds(self):
+        return self._seconds
+
+    # Get the number of seconds over which a client's budget refills
+    def window(self):
+        return self._window
+
+class EphemerisConfig:
+    def __init__(self, ephemeris_data):
+        self.data = ephemeris_data
+
+        self._start = self.data.get("start", "2023-06-01T00:00:00+00:00")
+        self._days = self.data.get("days", 2)
+        self._resolution = self.data.get("resolution", 1)
+        self._cache = self.data.get("cache", None)
+
+    def validate(self):
+        print("Validating ephemeris...", end=" ")
+        if self._resolution < 1:
+            print(f'ERROR: The ephemeris resolution needs to be at least 1 minute but got {self._resolution}')
+            exit()
+        print("success")
+
+    # Get the first time the sun position table covers
+    def start(self):
+        return auto.datetime.datetime.fromisoformat(self._start)
+
+    # Get how many days the sun position table covers
+    def days(self):
+        return self._days
+
+    # Get the minutes between samples of the sun position table
+    def resolution(self):
+        return self._resolution
+
+    # Get the directory the sun position table is cached in, if any
+    def cache(self):
+        if self._cache is None:
+            return None
+
+        return auto.pathlib.Path(self._cache)
+
 class ServerConfig:
     def __init__(self, server_data):
         self.data = server_data
@@ -60,6 +308,7 @@ class ServerConfig:
         self._port = self.data['port']
         self._logfile = self.data['logfile']
         self._observations = self.data['observations']
+        self._proxies = self.data['proxies']
 
     def validate(self):
         print("Validating server...", end=" ")
@@ -84,6 +333,13 @@ class ServerConfig:
 
         return self._bind
 
+    # Get the addresses of the proxies whose X-Forwarded-For is trusted
+    def proxies(self):
+        if 'SUNRISE_SERVER_PROXIES' in auto.os.environ:
+            return auto.os.environ['SUNRISE_SERVER_PROXIES'].split(',')
+
+        return self._proxies
+
     # Get the name of the server
     def name(self):
         return self._name
@@ -119,9 +375,21 @@ class Config:
         self._renderer = RendererConfig(self.config["renderer"])
         self._server = ServerConfig(self.config["server"])
         self._client = ClientConfig(self.config["client"])
+        self._lights = LightsConfig(self.config.get("lights", {}))
+        self._ephemeris = EphemerisConfig(self.config.get("ephemeris", {}))
+        self._park = ParkConfig(self.config.get("park", {}))
+        self._cache = CacheConfig(self.config.get("cache", {}))
+        self._encoding = EncodingConfig(self.config.get("encoding", {}))
+        self._fairness = FairnessConfig(self.config.get("fairness", {}))
 
         self._server.validate()
         self._renderer.validate()
+        self._lights.validate()
+        self._ephemeris.validate()
+        self._park.validate()
+        self._cache.validate()
+        self._encoding.validate()
+        self._fairness.validate()
         self._client
 
     @property
@@ -132,6 +400,30 @@ class Config:
     def server(self):
         return self._server
 
+    @property
+    def lights(self):
+        return self._lights
+
+    @property
+    def ephemeris(self):
+        return self._ephemeris
+
+    @property
+    def park(self):
+        return self._park
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def encoding(self):
+        return self._encoding
+
+    @property
+    def fairness(self):
+        return self._fairness
+
     
     def client_data_response(self):
         config_obj = json.dumps({
@@ -0,0 +1,331 @@
+"""
+
+"""
+
+from __future__ import annotations
+from ._auto import auto
+
+import concurrent.futures
+import multiprocessing
+import multiprocessing.shared_memory
+import threading
+import time
+import weakref
+
+import numpy as np
+
+import sunrise.raw
+from sunrise_encoder import encode, encode_shared
+
+__all__ = [
+    'MEDIA_TYPES',
+    'Encoder',
+    'SharedBuffers',
+    'negotiate',
+    'encode',
+]
+
+
+MEDIA_TYPES = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'raw': sunrise.raw.MEDIA_TYPE,
+}
+
+
+def negotiate(format: str | None, accept: str | None, /, *, default: str='png') -> str | None:
+    """Pick an output format: an explicit `format` wins, then `default`
+    unless the Accept header rules it out, then the supported media type
+    the Accept header prefers. None if the Accept header rules out every
+    supported type.
+
+    Browsers list image/webp in the Accept header of every <img>, so the
+    header alone never switches a client away from `default`.
+    """
+    if format is not None:
+        return format
+
+    if accept is None:
+        return default
+
+    # The q of the most specific media range matching each format
+    qs = {}
+    for item in accept.split(','):
+        media_type, *params = [part.strip() for part in item.split(';')]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+
+        for format, supported in MEDIA_TYPES.items():
+            if media_type == supported:
+                specificity = 2
+            elif media_type == supported.split('/')[0] + '/*':
+                specificity = 1
+            elif media_type == '*/*':
+                specificity = 0
+            else:
+                continue
+
+            if specificity >= qs.get(format, (-1, 0.0))[0]:
+                qs[format] = (specificity, q)
+
+    if qs.get(default, (0, 0.0))[1] > 0:
+        return default
+
+    best, best_q = None, 0.0
+    for format in MEDIA_TYPES:
+        # Earlier formats win ties
+        _, q = qs.get(format, (0, 0.0))
+        if q > best_q:
+            best, best_q = format, q
+
+    return best
+
+
+class SharedBuffers:
+    """Pixel arrays in shared memory segments that are reused.
+
+    An array handed out by `empty` gives its segment back once it and
+    every view of it are garbage collected; up to `keep` free segments are
+    kept for the next arrays, the oldest going first. A segment is only
+    reused for an array that needs at least half of it, so small tiles do
+    not pin large frames. `locate` finds the segment and offset of any
+    view of such an array, so an encoder process can read the pixels in
+    place.
+    """
+
+    def __init__(self, *, keep: int):
+        self.keep = keep
+
+        self._free: list[multiprocessing.shared_memory.SharedMemory] = []
+        # id of an array handed out -> its segment
+        self._leased: dict[int, multiprocessing.shared_memory.SharedMemory] = {}
+        # Unlinked segments whose mapping is still exported
+        self._closing: list[multiprocessing.shared_memory.SharedMemory] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.created = 0
+        self.reused = 0
+
+    def empty(self, shape: tuple[int, ...], dtype) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        self._close_unused()
+        with self._lock:
+            # The smallest free segment the pixels fit in, if not much larger
+            fits = [memory for memory in self._free if nbytes <= memory.size <= 2 * nbytes]
+            if fits:
+                memory = min(fits, key=lambda memory: memory.size)
+                self._free.remove(memory)
+                self.reused += 1
+            else:
+                memory = None
+
+        if memory is None:
+            memory = multiprocessing.shared_memory.SharedMemory(create=True, size=nbytes)
+            self.created += 1
+
+        pixels = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        with self._lock:
+            self._leased[id(pixels)] = memory
+        weakref.finalize(pixels, self._give_back, id(pixels))
+        return pixels
+
+    def _give_back(self, key: int):
+        with self._lock:
+            memory = self._leased.pop(key)
+            if self._closed:
+                evicted = [memory]
+            else:
+                self._free.append(memory)
+                evicted = self._free[:-self.keep] if self.keep > 0 else self._free[:]
+                del self._free[:len(evicted)]
+
+        # The array being collected still exports the buffer of its own
+        # segment, so that one is closed on a later call
+        for memory in evicted:
+            memory.unlink()
+            with self._lock:
+                self._closing.append(memory)
+        self._close_unused()
+
+    def _close_unused(self):
+        with self._lock:
+            closing, self._closing = self._closing, []
+
+        for memory in closing:
+            try:
+                memory.close()
+            except BufferError:
+                with self._lock:
+                    self._closing.append(memory)
+
+    # The segment name and byte offset of pixels that live in one of our
+    # segments, or None
+    def locate(self, pixels: np.ndarray) -> tuple[str, int] | None:
+        root = pixels
+        while isinstance(root.base, np.ndarray):
+            root = root.base
+
+        with self._lock:
+            memory = self._leased.get(id(root))
+        if memory is None:
+            return None
+
+        offset = pixels.__array_interface__['data'][0] - root.__array_interface__['data'][0]
+        return memory.name, offset
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            free, self._free = self._free, []
+
+        for memory in free:
+            memory.close()
+            memory.unlink()
+        self._close_unused()
+
+    def stats(self) -> dict:
+        return dict(
+            free=len(self._free),
+            leased=len(self._leased),
+            created=self.created,
+            reused=self.reused,
+        )
+
+
+class Encoder:
+    """Encode pixels to PNG, JPEG or WebP with configured settings.
+
+    Path-traced terrain has no useful alpha, so unless `png_alpha` is set
+    the alpha channel is dropped before encoding. Encode time and output
+    size are tallied per format.
+
+    aencode runs the encode in one of `workers` processes, so it neither
+    holds the GIL nor blocks the event loop. Pixels are handed over in
+    shared memory rather than pickled: Scenes read their frames out into
+    arrays from `empty`, which the encoder processes read in place, and
+    other pixels are copied into such an array first. With no workers it
+    encodes on a thread instead. Uncompressed raw output is only a header
+    and a copy, so it is always packed in place.
+    """
+
+    def __init__(
+        self,
+        *,
+        png_level: int=6,
+        png_alpha: bool=False,
+        jpeg_quality: int=85,
+        webp_quality: int=80,
+        webp_lossless: bool=False,
+        raw_level: int=1,
+        workers: int=0,
+    ):
+        self.settings = dict(
+            png_level=png_level,
+            png_alpha=png_alpha,
+            jpeg_quality=jpeg_quality,
+            webp_quality=webp_quality,
+            webp_lossless=webp_lossless,
+            raw_level=raw_level,
+        )
+        self.workers = workers
+        self._executor = None
+        self.buffers = SharedBuffers(keep=4 * max(workers, 1))
+
+        self.counts = dict.fromkeys(MEDIA_TYPES, 0)
+        self.bytes = dict.fromkeys(MEDIA_TYPES, 0)
+        self.times = dict.fromkeys(MEDIA_TYPES, 0)
+
+    @property
+    def executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                # Forking a process that runs OSPRay threads is not safe
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        self.buffers.close()
+
+    # An uninitialized pixel array that aencode can hand to the encoder
+    # processes without copying it
+    def empty(self, shape: tuple[int, ...], dtype) -> np.ndarray:
+        if self.workers < 1:
+            return np.empty(shape, dtype=dtype)
+
+        return self.buffers.empty(shape, dtype)
+
+    def tally(self, format: str, content: bytes, start: int):
+        self.counts[format] += 1
+        self.bytes[format] += len(content)
+        self.times[format] += time.perf_counter_ns() - start
+
+    def encode(self, pixels: np.ndarray, format: str, /, *, compress: bool=False) -> bytes:
+        start = time.perf_counter_ns()
+        content = encode(pixels, format, compress=compress, **self.settings)
+        self.tally(format, content, start)
+        return content
+
+    async def aencode(self, pixels: np.ndarray, format: str, /, *, compress: bool=False) -> bytes:
+        start = time.perf_counter_ns()
+        if format not in MEDIA_TYPES:
+            raise ValueError(f'Unsupported format: {format!r}')
+
+        if format == 'raw' and not compress:
+            return self.encode(pixels, format)
+
+        loop = auto.asyncio.get_running_loop()
+        if self.workers < 1:
+            content = await loop.run_in_executor(None, lambda: encode(pixels, format, compress=compress, **self.settings))
+            self.tally(format, content, start)
+            return content
+
+        located = self.buffers.locate(pixels)
+        if located is None:
+            shared = self.buffers.empty(pixels.shape, pixels.dtype)
+            shared[...] = pixels
+            pixels = shared
+            located = self.buffers.locate(pixels)
+
+        name, offset = located
+        # Holding `pixels` keeps its segment from being reused meanwhile
+        content = await loop.run_in_executor(
+            self.executor,
+            encode_shared,
+            name,
+            offset,
+            pixels.shape,
+            pixels.strides,
+            pixels.dtype.str,
+            format,
+            self.settings,
+            compress,
+        )
+
+        self.tally(format, content, start)
+        return content
+
+    def stats(self) -> dict:
+        stats = {
+            format: dict(
+                count=self.counts[format],
+                bytes=self.bytes[format],
+                time=self.times[format],
+            )
+            for format in MEDIA_TYPES
+        }
+        stats['buffers'] = self.buffers.stats()
+        return stats
@@ -0,0 +1,156 @@
+"""
+
+"""
+
+from __future__ import annotations
+from ._auto import auto
+
+import datetime
+import math
+import pathlib
+
+import numpy as np
+import skyfield, skyfield.api, skyfield.toposlib
+
+__all__ = [
+    'table',
+    'load',
+    'Ephemeris',
+]
+
+
+table: Ephemeris = None
+
+
+def load(*args, **kwargs) -> Ephemeris:
+    """Build the process-wide sun position table used by
+    model.location_from_datetime; later calls return the same table."""
+    global table
+    if table is not None:
+        return table
+
+    table = Ephemeris(*args, **kwargs)
+    table.make()
+    return table
+
+
+class Ephemeris:
+    """Sub-solar points precomputed over a date range.
+
+    The sun's geographic position is computed with one vectorized skyfield
+    call every `resolution` minutes from `start` for `days` days (or read
+    back from an .npy file in `cache`), and lookups interpolate between
+    neighbouring samples.
+    """
+
+    def __init__(
+        self,
+        *,
+        start: datetime.datetime,
+        days: float,
+        resolution: int=1,
+        cache: pathlib.Path | None=None,
+    ):
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=datetime.timezone.utc)
+
+        self.start = start
+        self.days = days
+        self.resolution = resolution
+        self.cache = cache
+
+        self.lat = None
+        self.lng = None
+
+    @property
+    def path(self) -> pathlib.Path | None:
+        if self.cache is None:
+            return None
+
+        start = self.start.astimezone(datetime.timezone.utc)
+        return pathlib.Path(self.cache) / f'ephemeris-{start:%Y%m%dT%H%MZ}-{self.days}d-{self.resolution}m.npy'
+
+    def make(self):
+        path = self.path
+        if path is not None and path.exists():
+            lat, lng = np.load(path)
+
+        else:
+            lat, lng = self.compute()
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                np.save(path, np.stack([lat, lng]))
+
+        self.lat = lat
+        # Unwrapped so that interpolating across the antimeridian works
+        self.lng = np.degrees(np.unwrap(np.radians(lng)))
+
+    def compute(
+        self,
+        *,
+        planets=None,
+        timescale=None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if planets is None:
+            planets = skyfield.api.load('de421.bsp')
+        if timescale is None:
+            timescale = skyfield.api.load.timescale()
+
+        sun = planets['sun']
+        earth = planets['earth']
+
+        count = int(math.ceil(self.days * 24 * 60 / self.resolution)) + 1
+        minutes = np.arange(count) * self.resolution
+        start = self.start.astimezone(datetime.timezone.utc)
+        now = timescale.utc(
+            start.year, start.month, start.day,
+            start.hour, start.minute + minutes, start.second,
+        )
+
+        position = earth.at(now).observe(sun).apparent()
+
+        location = skyfield.toposlib.wgs84.geographic_position_of(position)
+        return location.latitude.degrees, location.longitude.degrees
+
+    # Hours since `start` of a datetime
+    def hours(self, when: datetime.datetime, /) -> float:
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=datetime.timezone.utc)
+        return (when - self.start).total_seconds() / 3600
+
+    def covers(self, when: datetime.datetime, /) -> bool:
+        return 0.0 <= self.hours(when) <= self.days * 24
+
+    def locations(self, hours: np.ndarray, /) -> tuple[np.ndarray, np.ndarray]:
+        """Latitudes and longitudes (degrees) of the sub-solar point for an
+        array of hours since `start`."""
+        samples = np.asarray(hours, dtype=np.float64) * 60 / self.resolution
+        index = np.arange(len(self.lat))
+
+        lat = np.interp(samples, index, self.lat)
+        lng = np.interp(samples, index, self.lng)
+        lng = (lng + 180.0) % 360.0 - 180.0
+        return lat, lng
+
+    def positions(self, hours: np.ndarray, /, *, alt: float) -> np.ndarray:
+        """Sun positions, as model.position_from_location computes them, for
+        an array of hours since `start`; one (x, y, z) row per hour."""
+        lat, lng = self.locations(hours)
+        phi = np.radians(lat)
+        theta = np.radians(lng)
+        rho = 6_371 + alt
+
+        x = np.cos(phi) * np.cos(theta) * rho
+        y = np.cos(phi) * np.sin(theta) * rho
+        z = np.sin(phi) * rho
+
+        # y is up, see model.position_from_location
+        return np.stack([x, z, y], axis=-1)
+
+    def location(self, when: datetime.datetime, /, *, alt: float, cls):
+        lat, lng = self.locations(np.array([self.hours(when)]))
+        return cls(
+            lat=float(lat[0]),
+            lng=float(lng[0]),
+            alt=alt,
+        )
@@ -0,0 +1,107 @@
+"""
+
+"""
+
+from __future__ import annotations
+from ._auto import auto
+
+import collections
+import time
+
+import sunrise.pool
+
+__all__ = [
+    'RenderBudgets',
+]
+
+
+class RenderBudgets:
+    """Render time each client may use, kept in token buckets.
+
+    Every client (an address) has a bucket of up to `seconds` seconds of
+    render time, refilled at `seconds` per `window` seconds. Each render
+    takes the time it held a Scene from the bucket of the client that
+    asked for it. Since that time is only known once the render is done,
+    a render is charged the average time of recent renders (see reserve)
+    as soon as it is queued, and the difference when it finishes; a burst
+    of requests thus empties the bucket before any of them has finished.
+    A client whose bucket is empty is over budget: its renders are not
+    rejected, but demoted below every regular priority, so they wait
+    behind other clients' renders (aging still gets them a Scene
+    eventually). With `seconds` 0 nobody is limited. Only the `clients`
+    most recently seen clients are remembered.
+    """
+
+    def __init__(self, *, seconds: float, window: float, clients: int=4096, smoothing: float=0.1):
+        self.seconds = seconds
+        self.window = window
+        self.clients = clients
+        self.smoothing = smoothing
+
+        # Moving average of the seconds one render is charged
+        self.estimate = 0.0
+
+        # client -> [tokens, monotonic time of the last refill]
+        self._buckets: collections.OrderedDict[str, list[float]] = collections.OrderedDict()
+
+        self.demoted = 0
+        self.charged = 0.0
+
+    # The seconds left in a bucket at monotonic time `now`
+    def _tokens(self, bucket: list[float], now: float) -> float:
+        tokens, updated = bucket
+        return min(self.seconds, tokens + (now - updated) * self.seconds / self.window)
+
+    def _bucket(self, client: str) -> list[float]:
+        now = time.monotonic()
+        bucket = self._buckets.pop(client, None)
+        if bucket is None:
+            bucket = [self.seconds, now]
+        else:
+            bucket[:] = [self._tokens(bucket, now), now]
+
+        self._buckets[client] = bucket
+        while len(self._buckets) > self.clients:
+            self._buckets.popitem(last=False)
+        return bucket
+
+    def over(self, client: str, /) -> bool:
+        return self.seconds > 0 and self._bucket(client)[0] <= 0
+
+    # The priority a render of `client` waits for a Scene with
+    def demote(self, client: str, priority: int, /) -> int:
+        if not self.over(client):
+            return priority
+
+        self.demoted += 1
+        return priority + len(sunrise.pool.PRIORITIES)
+
+    # Charge `client` the estimate for a render it is about to wait for;
+    # returns what was charged, to hand to charge() once it is done
+    def reserve(self, client: str, /) -> float:
+        seconds = self.estimate
+        if self.seconds > 0:
+            self._bucket(client)[0] -= seconds
+        return seconds
+
+    # Give back what was reserved for a render that never got a Scene
+    def refund(self, client: str, reserved: float, /):
+        if self.seconds > 0:
+            self._bucket(client)[0] += reserved
+
+    # Charge `client` the `seconds` a render took, less what was reserved
+    def charge(self, client: str, seconds: float, /, *, reserved: float=0.0):
+        self.charged += seconds
+        self.estimate += (seconds - self.estimate) * self.smoothing
+        if self.seconds > 0:
+            self._bucket(client)[0] -= seconds - reserved
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return dict(
+            clients=len(self._buckets),
+            over=sum(1 for bucket in self._buckets.values() if self.seconds > 0 and self._tokens(bucket, now) <= 0),
+            demoted=self.demoted,
+            charged=self.charged,
+            estimate=self.estimate,
+        )
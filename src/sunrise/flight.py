@@ -0,0 +1,70 @@
+"""
+
+"""
+
+from __future__ import annotations
+from ._auto import auto
+
+import asyncio
+import typing
+
+__all__ = [
+    'SingleFlight',
+]
+
+
+class SingleFlight:
+    """Run at most one task per key at a time.
+
+    The first caller for a key (the leader) starts the task; callers that
+    arrive while it runs (followers) await the same task instead of
+    starting their own. The task is shielded from any one caller being
+    cancelled and is only cancelled once nobody awaits it anymore.
+    """
+
+    def __init__(self):
+        self._flights: dict[str, list] = {}
+
+        self.leaders = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: str, factory: typing.Callable[[], typing.Awaitable], /):
+        flight = self._flights.get(key)
+        if flight is None:
+            task = auto.asyncio.ensure_future(factory())
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda _task: self._land(key, flight))
+            self.leaders += 1
+
+        else:
+            self.coalesced += 1
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await auto.asyncio.shield(task)
+
+        except asyncio.CancelledError:
+            if flight[1] == 1 and not task.done():
+                # Callers arriving from now on start a new flight rather
+                # than join this dying one
+                self._land(key, flight)
+                task.cancel()
+            raise
+
+        finally:
+            flight[1] -= 1
+
+    def _land(self, key: str, flight: list):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return dict(
+            flights=len(self._flights),
+            leaders=self.leaders,
+            coalesced=self.coalesced,
+        )
@@ -4,7 +4,7 @@
 
 from __future__ import annotations
 
-import sunrise.util
+import sunrise.util, sunrise.ephemeris
 
 import functools
 import ctypes
@@ -109,6 +109,11 @@ def location_from_datetime(
     timescale=skyfield.api.load.timescale(),
     cls=Location,
 ):
+    # Interpolate from the precomputed table when one covers this time
+    table = sunrise.ephemeris.table
+    if table is not None and table.covers(when):
+        return table.location(when, alt=alt, cls=cls)
+
     sun = planets['sun']
     earth = planets['earth']
 
@@ -154,7 +159,42 @@ class RenderingRequest:
     hour: float
     light: str
     observation: str
+    # Keep accumulating passes until the variance estimate drops below
+    # this target, but never for more than `passes` passes
+    variance: float | None = None
+    passes: int | None = None
+    # Pixel type of the response: sRGB 'uint8', or linear 'float32' from a
+    # float framebuffer
+    dtype: typing.Literal['uint8', 'float32'] = 'uint8'
+    # Render this many rows x cols of tiles, starting at `tile`, as one frame
+    span: tuple[
+        typing.Annotated[int, 'rows'],
+        typing.Annotated[int, 'cols'],
+    ] = (1, 1)
+
+    # Size in pixels of the whole frame, without its ghost border
+    @property
+    def frame_width(self) -> int:
+        return self.width * self.span[1]
+
+    @property
+    def frame_height(self) -> int:
+        return self.height * self.span[0]
 
 @dataclasses.dataclass
 class RenderingResponse:
-   image: PIL.Image
+   pixels: np.ndarray
+   variance: float = math.inf
+   passes: int = 1
+
+   # A PIL view of the pixels; no copy is made for contiguous RGBA8 arrays
+   @property
+   def image(self) -> PIL.Image.Image:
+      return PIL.Image.fromarray(self.pixels)
+
+   # The pixels of one tile of a response that spans several tiles
+   def tile(self, row: int, col: int, *, width: int, height: int) -> RenderingResponse:
+      return dataclasses.replace(
+         self,
+         pixels=self.pixels[row*height:(row+1)*height, col*width:(col+1)*width],
+      )
@@ -0,0 +1,182 @@
+"""
+
+"""
+
+from __future__ import annotations
+from ._auto import auto
+
+import asyncio
+import collections
+import contextlib
+import heapq
+import itertools
+
+__all__ = [
+    'PRIORITIES',
+    'PoolFull',
+    'ScenePool',
+]
+
+
+# Lower goes first: drag previews, then settled views, then animation frames
+PRIORITIES = dict(
+    interactive=0,
+    final=1,
+    animation=2,
+)
+
+
+class PoolFull(Exception):
+    """Raised when the admission queue of a ScenePool is already full."""
+
+
+class ScenePool:
+    """A fixed set of Scene workers with a bounded admission queue.
+
+    At most `queue` requests wait for a busy pool; more are rejected with
+    PoolFull. Waiters go by priority, where each level counts as `aging`
+    seconds of waiting, and a Scene goes to the request it is cheapest to
+    switch to (see Scene.switch_cost).
+    """
+
+    def __init__(self, scenes: list, *, queue: int, aging: float=0.0):
+        self.scenes = tuple(scenes)
+        self._idle = collections.deque(scenes)
+        # Heap of [arrival + priority * aging, order, priority, future,
+        # request, times passed over]
+        self._waiters = []
+        self._order = itertools.count()
+
+        self.size = len(scenes)
+        self.queue = queue
+        self.aging = aging
+        self.rejected = 0
+
+        self.acquired = dict.fromkeys(PRIORITIES.values(), 0)
+        self.waited = dict.fromkeys(PRIORITIES.values(), 0.0)
+
+        self.matched = 0
+        self.switched = 0
+        self.switch_cost = 0
+        self.switch_time = 0
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def full(self) -> bool:
+        return not self._idle and len(self._waiters) >= self.queue
+
+    async def acquire(self, priority: int=PRIORITIES['final'], request=None):
+        self.acquired[priority] = self.acquired.get(priority, 0) + 1
+        if self._idle and not self._waiters:
+            if request is None:
+                return self._idle.popleft()
+
+            scene = min(self._idle, key=lambda scene: scene.switch_cost(request))
+            self._idle.remove(scene)
+            return scene
+
+        if len(self._waiters) >= self.queue:
+            self.acquired[priority] -= 1
+            self.rejected += 1
+            raise PoolFull()
+
+        loop = auto.asyncio.get_running_loop()
+        arrival = loop.time()
+        future = loop.create_future()
+        waiter = [arrival + priority * self.aging, next(self._order), priority, future, request, 0]
+        heapq.heappush(self._waiters, waiter)
+        try:
+            return await future
+
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # We were handed a Scene just as we were cancelled
+                self.release(future.result())
+            else:
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+            raise
+
+        finally:
+            self.waited[priority] = self.waited.get(priority, 0.0) + loop.time() - arrival
+
+    def release(self, scene):
+        while self._waiters and self._waiters[0][3].done():
+            heapq.heappop(self._waiters)
+
+        if not self._waiters:
+            self._idle.append(scene)
+            return
+
+        head = self._waiters[0]
+        waiter = head
+        # Among the waiters of the first one's priority, the Scene goes to
+        # the one it is cheapest to switch to; the first one is only passed
+        # over `size` times, so it cannot starve
+        if head[5] < self.size:
+            tier = [
+                other
+                for other in self._waiters
+                if other[2] == head[2] and not other[3].done()
+            ]
+            waiter = min(tier, key=lambda other: (
+                0 if other[4] is None else scene.switch_cost(other[4]),
+                other[0],
+                other[1],
+            ))
+
+        if waiter is head:
+            heapq.heappop(self._waiters)
+        else:
+            head[5] += 1
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+
+        waiter[3].set_result(scene)
+
+    @contextlib.asynccontextmanager
+    async def checkout(self, priority: int=PRIORITIES['final'], request=None):
+        scene = await self.acquire(priority, request)
+        if request is not None:
+            cost = scene.switch_cost(request)
+            if cost:
+                self.switched += 1
+                self.switch_cost += cost
+            else:
+                self.matched += 1
+            switch_ns = scene.switch_ns
+
+        try:
+            yield scene
+        finally:
+            if request is not None:
+                self.switch_time += scene.switch_ns - switch_ns
+            self.release(scene)
+
+    def stats(self) -> dict:
+        return dict(
+            size=self.size,
+            idle=self.idle,
+            waiting=self.waiting,
+            queue=self.queue,
+            rejected=self.rejected,
+            matched=self.matched,
+            switched=self.switched,
+            switch_cost=self.switch_cost,
+            switch_time=self.switch_time,
+            priorities={
+                name: dict(
+                    acquired=self.acquired.get(priority, 0),
+                    waited=self.waited.get(priority, 0.0),
+                )
+                for name, priority in PRIORITIES.items()
+            },
+        )
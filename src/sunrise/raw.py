@@ -0,0 +1,26 @@
+"""
+
+"""
+
+from __future__ import annotations
+from ._auto import auto
+
+# The format is defined next to the encoders, which run in processes that
+# do not import the sunrise package
+from sunrise_encoder import (
+    MEDIA_TYPE,
+    HEADER,
+    MAGIC,
+    VERSION,
+    ZLIB,
+    DTYPES,
+    pack,
+    unpack,
+)
+
+__all__ = [
+    'MEDIA_TYPE',
+    'HEADER',
+    'pack',
+    'unpack',
+]
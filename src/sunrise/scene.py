@@ -5,8 +5,10 @@
 from __future__ import annotations
 
 from ._auto import auto
-import sunrise.util, sunrise.model
+import sunrise.util, sunrise.model, sunrise.assets
 
+import collections
+import concurrent.futures
 import contextlib
 import ctypes
 import dataclasses
@@ -27,10 +29,24 @@ import PIL.Image
 import skyfield, skyfield.api, skyfield.toposlib
 import threading
 import json
+import structlog
 
 obs_cond = threading.Condition()
 obs_lock = threading.Lock()
 
+logger = structlog.get_logger(__name__)
+
+GHOST = 16
+
+# Rough relative costs of bringing a Scene to the state of a request
+SWITCH_COSTS = dict(
+    model=1,  # swap in a cached ObservationModel
+    observation=8,  # build a model from an observation already in memory
+    load=32,  # read an observation from disk and build its model
+    light=1,  # copy cached lights into the light array
+    sunlight=4,  # look up the sun position and make new lights
+)
+
 __all__ = [
     'lib',
     'load_library',
@@ -57,7 +73,6 @@ def Read(
     *,
     dtype: np.DType,
 ) -> np.NDArray:
-    print(f'trying to open {path}: ', end='')
     with open(path, 'r+b') as f:
         def Read(fmt: str, /) -> tuple:
             size = struct.calcsize(fmt)
@@ -72,7 +87,7 @@ def Read(
         data = np.memmap(f, dtype=dtype, shape=shape, mode='r', offset=f.tell())
 
     data = data.reshape(shape)
-    print('success')
+    logger.debug(event='asset_read', path=str(path), shape=list(shape))
     return data
 
 
@@ -147,6 +162,25 @@ def Data(
     return dst
 
 
+def Copy(
+    array: np.ndarray | list,
+    /,
+    *,
+    type: lib.OSPDataType,
+    dst: lib.OSPData,
+):
+    """Copy array into the existing OSPData dst, which keeps its identity so
+    objects referring to it only need to be recommitted."""
+    if isinstance(array, list):
+        array = (ctypes.cast(x, ctypes.c_void_p).value for x in array)
+        array = np.fromiter(array, dtype=np.uintp)
+
+    src = Data(array, type=type, share=True)
+    lib.ospCopyData(src, dst, 0, 0, 0)
+    lib.ospRelease(src)
+    lib.ospCommit(dst)
+
+
 def Affine3f(
     *,
     sx: float = 1.0,
@@ -164,6 +198,27 @@ def Affine3f(
     )
 
 
+async def Wait(
+    future: lib.OSPFuture,
+    /,
+    *,
+    event: lib.OSPSyncEvent | None=None,
+    interval: float=0.0005,
+    max_interval: float=0.008,
+):
+    """Await an OSPFuture from the event loop by polling ospIsReady.
+
+    The polling interval starts small so fast tiles return promptly and
+    backs off up to max_interval for long frames.
+    """
+    if event is None:
+        event = lib.OSP_TASK_FINISHED
+
+    while not lib.ospIsReady(future, event):
+        await auto.asyncio.sleep(interval)
+        interval = min(interval * 2, max_interval)
+
+
 def with_exit_stack(func: callable, /):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
@@ -205,7 +260,6 @@ class Building(WithExitStackMixin):
     
     def make(self):
         position = self.path / 'TOSPGeometry.mesh.vec3f[].vertex.position.bin'
-        print(f'Loading vertices {position}')
         position = Map(position, dtype=[
             ('x', 'f4'),
             ('y', 'f4'),
@@ -216,7 +270,6 @@ class Building(WithExitStackMixin):
         self.defer(lib.ospRelease, position)
 
         quad_index = self.path / 'TOSPGeometry.mesh.vec4u[].index.bin'
-        print(f'Loading quads {quad_index}')
         quad_index = Map(quad_index, dtype=[
             ('a', 'u4'),
             ('b', 'u4'),
@@ -237,10 +290,13 @@ class Building(WithExitStackMixin):
         zhi = position['z'].max()
         zmi = (zlo + zhi) / 2
         
-        print(self.path)
-        print(f'[ {xlo:.1f} ]-[ {xmi:.1f} ]-[ {xhi:.1f} ] ({position["x"][0]:.1f})')
-        print(f'[ {ylo:.1f} ]-[ {ymi:.1f} ]-[ {yhi:.1f} ] ({position["y"][0]:.1f})')
-        print(f'[ {zlo:.1f} ]-[ {zmi:.1f} ]-[ {zhi:.1f} ] ({position["z"][0]:.1f})')
+        logger.debug(
+            event='asset_bounds',
+            path=str(self.path),
+            x=[float(xlo), float(xmi), float(xhi)],
+            y=[float(ylo), float(ymi), float(yhi)],
+            z=[float(zlo), float(zmi), float(zhi)],
+        )
 
         geometry = lib.ospNewGeometry(b'mesh')
         self.defer(lib.ospRelease, geometry)
@@ -267,7 +323,6 @@ class Building(WithExitStackMixin):
         # lib.ospCommit(geometry)
         # print('loaded geometry')
 
-        print(f'loading materials')
         materials = []
         with open(self.path / 'OSPMaterial[].obj.vec3f.kd.bin', 'rb') as f:
             for i in range(256):
@@ -287,48 +342,37 @@ class Building(WithExitStackMixin):
             *materials,
         ], type=lib.OSP_MATERIAL)
         self.defer(lib.ospRelease, materials)
-        print('loaded materials')
 
         index = self.path / 'TOSPGeometricModel.uchar[].index.bin'
         # index = self.path / 'OSPGeometricModel.uchar[].index.bin'
-        print(f'loading index {index}')
         index = Map(index, dtype=[
             ('i', 'u1'),
         ])
         self.hold(index)
         index = Data(index, type=lib.OSP_UCHAR, share=True)
         self.defer(lib.ospRelease, index)
-        print('loaded index')
 
-        print(f'loading geomodel')
         geomodel = lib.ospNewGeometricModel(None)
         self.defer(lib.ospRelease, geomodel)
         lib.ospSetObject(geomodel, b'geometry', geometry)
         lib.ospSetObject(geomodel, b'material', materials)
         lib.ospSetObject(geomodel, b'index', index)
         lib.ospCommit(geomodel)
-        print('loaded geomodel')
 
-        print(f'loading geomodels')
         geomodels = Data([
             geomodel,
         ], type=lib.OSP_GEOMETRIC_MODEL)
         self.defer(lib.ospRelease, geomodel)
-        print('loaded geomodels')
 
-        print(f'loading group')
         group = lib.ospNewGroup()
         self.defer(lib.ospRelease, group)
         lib.ospSetObject(group, b'geometry', geomodels)
         lib.ospCommit(group)
-        print('loaded group')
 
-        print(f'loading instance')
         instance = lib.ospNewInstance(None)
         self.defer(lib.ospRelease, instance)
         lib.ospSetObject(instance, b'group', group)
         lib.ospCommit(instance)
-        print('loaded instance')
 
         self.instance = instance
 
@@ -342,66 +386,51 @@ class Background(WithExitStackMixin):
     
     def make(self):
         vertex__position = self.path / 'OSPGeometry.mesh.vec3f[].vertex.position.bin'
-        print(f'loading vertex.position {vertex__position}')
         vertex__position = Map(vertex__position, dtype=[
             ('x', 'f4'), ('y', 'f4'), ('z', 'f4'),
         ])
         self.hold(vertex__position)
         vertex__position = Data(vertex__position, type=lib.OSP_VEC3F, share=True)
         self.defer(lib.ospRelease, vertex__position)
-        print('loaded vertex.position')
         
         vertex__color = self.path / 'OSPGeometry.mesh.vec3f[].vertex.color.bin'
-        print(f'loading vertex.color {vertex__color}')
         vertex__color = Map(vertex__color, dtype=[
             ('r', 'f4'), ('g', 'f4'), ('b', 'f4'),
         ])
         self.hold(vertex__color)
         vertex__color = Data(vertex__color, type=lib.OSP_VEC3F, share=True)
         self.defer(lib.ospRelease, vertex__color)
-        print('loaded vertex.color')
         
         index = self.path / 'OSPGeometry.mesh.vec3ui[].index.bin'
-        print(f'loading index {index}')
         index = Map(index, dtype=[
             ('i', 'u4'), ('j', 'u4'), ('k', 'u4'),
         ])
         self.hold(index)
         index = Data(index, type=lib.OSP_VEC4UI-1, share=True)
         self.defer(lib.ospRelease, index)
-        print('loaded index')
 
-        print(f'loading geometry')
         geometry = lib.ospNewGeometry(b'mesh')
         self.defer(lib.ospRelease, geometry)
         lib.ospSetObject(geometry, b'vertex.position', vertex__position)
         lib.ospSetObject(geometry, b'vertex.color', vertex__color)
         lib.ospSetObject(geometry, b'index', index)
         lib.ospCommit(geometry)
-        print('loaded geometry')
 
-        print(f'loading geomodel')
         geomodel = lib.ospNewGeometricModel(None)
         self.defer(lib.ospRelease, geomodel)
         lib.ospSetObject(geomodel, b'geometry', geometry)
         lib.ospCommit(geomodel)
-        print('loaded geomodel')
 
-        print(f'loading geomodels')
         geomodels = Data([
             geomodel,
         ], type=lib.OSP_GEOMETRIC_MODEL)
         self.defer(lib.ospRelease, geomodels)
-        print('loaded geomodels')
 
-        print(f'loading group')
         group = lib.ospNewGroup()
         self.defer(lib.ospRelease, group)
         lib.ospSetObject(group, b'geometry', geomodels)
         lib.ospCommit(group)
-        print('loaded group')
 
-        print(f'loading instance')
         instance = lib.ospNewInstance(None)
         self.defer(lib.ospRelease, instance)
         lib.ospSetObject(instance, b'group', group)
@@ -411,7 +440,6 @@ class Background(WithExitStackMixin):
             sz=-1.0 * self.scale,
         ))
         lib.ospCommit(instance)
-        print('loaded instance')
 
         self.instance = instance
 
@@ -423,46 +451,37 @@ class City(WithExitStackMixin):
         self.path = path
     
     def make(self):
-        building = self.path / 'Building'
-        print(f'loading building {building}')
-        building = self.enter(Building(
-            path=building,
-        ))
-        print('loaded building')
-        
-        earth = auto.pathlib.Path('data') / 'city' / 'Earth'
-        print(f'loading earth {earth}')
-        earth = self.enter(Background(
-            path=earth,
-            scale=0.99 ** 4,
-        ))
-        print('loaded earth')
-
-        usa = self.path / 'USA'
-        print(f'loading usa {usa}')
-        usa = self.enter(Background(
-            path=usa,
-            scale=0.99 ** 3,
-        ))
-        print('loaded usa')
+        parts = [
+            Building(
+                path=self.path / 'Building',
+            ),
+            Background(
+                path=auto.pathlib.Path('data') / 'city' / 'Earth',
+                scale=0.99 ** 4,
+            ),
+            Background(
+                path=self.path / 'USA',
+                scale=0.99 ** 3,
+            ),
+            Background(
+                path=self.path / 'TN',
+                scale=0.99 ** 2,
+            ),
+            Background(
+                path=self.path / 'Knox',
+                scale=0.99 ** 1,
+            ),
+        ]
+        for part in parts:
+            self.defer(part.close)
 
-        tn = self.path / 'TN'
-        print(f'loading tn {tn}')
-        tn = self.enter(Background(
-            path=tn,
-            scale=0.99 ** 2,
-        ))
-        print('loaded tn')
+        # The parts are independent, so their files are read concurrently
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            for row in executor.map(sunrise.assets.measure, parts):
+                logger.info(event='asset_loaded', **row)
 
-        knox = self.path / 'Knox'
-        print(f'loading knox {knox}')
-        knox = self.enter(Background(
-            path=knox,
-            scale=0.99 ** 1,
-        ))
-        print('loaded knox')
+        building, earth, usa, tn, knox = parts
 
-        print(f'loading instances')
         instances = Data([
             building.instance,
             earth.instance,
@@ -471,7 +490,6 @@ class City(WithExitStackMixin):
             knox.instance,
         ], type=lib.OSP_INSTANCE)
         self.defer(lib.ospRelease, instances)
-        print('loaded instances')
 
         self.instances = instances
 
@@ -496,10 +514,13 @@ class Terrain(WithExitStackMixin):
         zhi = position['z'].max()
         zmi = (zlo + zhi) / 2
 
-        print(self.path)
-        print(f'[ {xlo:.1f} ]-[ {xmi:.1f} ]-[ {xhi:.1f} ] ({position["x"][0]:.1f})')
-        print(f'[ {ylo:.1f} ]-[ {ymi:.1f} ]-[ {yhi:.1f} ] ({position["y"][0]:.1f})')
-        print(f'[ {zlo:.1f} ]-[ {zmi:.1f} ]-[ {zhi:.1f} ] ({position["z"][0]:.1f})')
+        logger.debug(
+            event='asset_bounds',
+            path=str(self.path),
+            x=[float(xlo), float(xmi), float(xhi)],
+            y=[float(ylo), float(ymi), float(yhi)],
+            z=[float(zlo), float(zmi), float(zhi)],
+        )
 
         self.hold(position)
         position = Data(position, type=lib.OSP_VEC3F, share=True)
@@ -580,10 +601,95 @@ class Observation(WithExitStackMixin):
         index = Read(index, dtype='u1')
         assert index is not None
         self.hold(index)
+        nbytes = index.nbytes
         index = Data(index, type=lib.OSP_UCHAR, share=True)
         self.defer(lib.ospRelease, index)
 
         self.index = index
+        self.nbytes = nbytes
+
+
+class Observations:
+    """Observations loaded from disk, shared by every Park of the process.
+
+    The index of an observation is shared with OSPRay, not copied, so it
+    stays loaded while any model uses it (see acquire). Observations no
+    model uses are kept in least recently used order, and evicted once
+    together with the ones in use they take more than `capacity` bytes.
+    """
+
+    def __init__(self, *, capacity: int, assets: sunrise.assets.Assets):
+        self.capacity = capacity
+        self.assets = assets
+
+        # path -> observation, least recently used first
+        self._loaded: collections.OrderedDict[auto.pathlib.Path, Observation] = collections.OrderedDict()
+        self._users: dict[auto.pathlib.Path, int] = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Get the observation at `path`, counted as used until it is released
+    def acquire(self, path: auto.pathlib.Path, /) -> Observation:
+        with self._lock:
+            observation = self._loaded.pop(path, None)
+            if observation is not None:
+                self.hits += 1
+
+            else:
+                observation = self.assets.acquire(Observation, path)
+                self.misses += 1
+                self.bytes += observation.nbytes
+
+            self._loaded[path] = observation
+            self._users[path] = self._users.get(path, 0) + 1
+            self._evict()
+            return observation
+
+    def release(self, observation: Observation, /):
+        with self._lock:
+            self._users[observation.path] -= 1
+            self._evict()
+
+    # Whether the observation at `path` is in memory, so using it reads nothing
+    def loaded(self, path: auto.pathlib.Path, /) -> bool:
+        return path in self._loaded
+
+    def _evict(self):
+        for path, observation in list(self._loaded.items()):
+            if self.bytes <= self.capacity:
+                break
+
+            if self._users.get(path, 0) > 0:
+                continue
+
+            del self._loaded[path]
+            self._users.pop(path, None)
+            self.bytes -= observation.nbytes
+            self.assets.release(observation)
+            self.evictions += 1
+
+    def close(self):
+        with self._lock:
+            while self._loaded:
+                path, observation = self._loaded.popitem()
+                self._users.pop(path, None)
+                self.bytes -= observation.nbytes
+                self.assets.release(observation)
+
+    def stats(self) -> dict:
+        return dict(
+            observations=len(self._loaded),
+            used=sum(1 for users in self._users.values() if users > 0),
+            bytes=self.bytes,
+            capacity=self.capacity,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
 
 
 class Environment(WithExitStackMixin):
@@ -605,27 +711,38 @@ class Environment(WithExitStackMixin):
             for colormap in self.colormaps
         ], type=lib.OSP_MATERIAL)
         self.defer(lib.ospRelease, colormaps)
+        self.materials = colormaps
+
+        geomodel, geomodels, group, instance = self.build(self, self.observation)
+
+        self.geomodel = geomodel
+        self.group = group
+        self.geomodels = geomodels
+        self.instance = instance
 
+    # Commit a geomodel, group and instance of the terrain colored by the
+    # observation; their releases are deferred to owner
+    def build(self, owner: WithExitStackMixin, observation: Observation | None):
         geomodel = lib.ospNewGeometricModel(None)
-        self.defer(lib.ospRelease, geomodel)
+        owner.defer(lib.ospRelease, geomodel)
         lib.ospSetObject(geomodel, b'geometry', self.terrain.geometry)
-        lib.ospSetObject(geomodel, b'material', colormaps)
-        if self.observation is not None:
-            lib.ospSetObject(geomodel, b'index', self.observation.index)
+        lib.ospSetObject(geomodel, b'material', self.materials)
+        if observation is not None:
+            lib.ospSetObject(geomodel, b'index', observation.index)
         lib.ospCommit(geomodel)
 
         geomodels = Data([
             geomodel,
         ], type=lib.OSP_GEOMETRIC_MODEL)
-        # self.defer(lib.ospRelease, geomodels)
+        owner.defer(lib.ospRelease, geomodels)
 
         group = lib.ospNewGroup()
-        self.defer(lib.ospRelease, group)
+        owner.defer(lib.ospRelease, group)
         lib.ospSetObject(group, b'geometry', geomodels)
         lib.ospCommit(group)
 
         instance = lib.ospNewInstance(None)
-        self.defer(lib.ospRelease, instance)
+        owner.defer(lib.ospRelease, instance)
         lib.ospSetObject(instance, b'group', group)
         lib.ospSetAffine3f(instance, b'transform', Affine3f(
             sx=1/1000,
@@ -634,82 +751,124 @@ class Environment(WithExitStackMixin):
         ))
         lib.ospCommit(instance)
 
-        self.geomodel = geomodel
-        self.group = group
-        self.geomodels = geomodels
-        self.instance = instance
-    
-    def update_index(self, index):
-        geomodel = self.geomodel
-        geomodels = self.geomodels
-        instance = self.instance
-        group = self.group
+        return geomodel, geomodels, group, instance
 
-        lib.ospSetObject(geomodel, b'index', index)
-        lib.ospCommit(geomodel)
 
-        lib.ospRelease(geomodels)
-        new_geomodels = Data([
-            geomodel,
-        ], type=lib.OSP_GEOMETRIC_MODEL)
+class ObservationModel(WithExitStackMixin):
+    """The environment colored by one observation, committed once, along
+    with the instance array a world shows it with. The observation counts
+    as used for as long as the model exists."""
 
-        lib.ospSetObject(group, b'geometry', new_geomodels)
-        lib.ospCommit(group)
-        
-        lib.ospSetObject(instance, b'group', group)
-        lib.ospCommit(instance)
-        
-        self.geomodels = new_geomodels
+    def __init__(
+        self,
+        environment: Environment,
+        observations: Observations,
+        path: auto.pathlib.Path,
+        others: list[lib.OSPInstance],
+    ):
+        super().__init__()
+
+        self.environment = environment
+        self.observations = observations
+        self.path = path
+        self.others = others
+
+    def make(self):
+        observation = self.observations.acquire(self.path)
+        self.defer(self.observations.release, observation)
+        self.observation = observation
+
+        _geomodel, _geomodels, _group, instance = self.environment.build(self, observation)
+
+        instances = Data([
+            instance,
+            *self.others,
+        ], type=lib.OSP_INSTANCE)
+        self.defer(lib.ospRelease, instances)
+
+        self.instance = instance
+        self.instances = instances
 
 
 class Park(WithExitStackMixin):
-    def __init__(self, path: auto.pathlib.Path):
+    def __init__(
+        self,
+        path: auto.pathlib.Path,
+        observations: Observations,
+        models: int=8,
+        loaders: int | None=None,
+        assets: sunrise.assets.Assets | None=None,
+    ):
         super().__init__()
 
+        if assets is None:
+            assets = sunrise.assets.registry
+
         self.path = path
+        self.assets = assets
+        self.observations = observations
+        self.loaders = loaders
+        # How many prebuilt observation models to keep
+        self.capacity = models
+        self.models = collections.OrderedDict()
     
+    # Get a shared asset, released again when this Park closes
+    def asset(self, cls: type, path: auto.pathlib.Path):
+        asset = self.assets.acquire(cls, path)
+        self.defer(self.assets.release, asset)
+        return asset
+
     def make(self):
         
-        self.observations = {
-                '0000341': self.enter(Observation(
-                    path=self.path / 'observation_0000341'
-                )),
-                '0000172': self.enter(Observation(
-                    path=self.path / 'observation_0000172'
-                )),
-                '0000223': self.enter(Observation(
-                    path=self.path / 'observation_0000223'
-                )),
+        paths = {
+                '0000341': self.path / 'observation_0000341',
+                '0000172': self.path / 'observation_0000172',
+                '0000223': self.path / 'observation_0000223',
         }
         with open('species_matrix.csv', 'r') as f:
             slist = auto.pd.read_csv(f, header=0).groupby('Species').first()
             for s in slist:
-                self.observations[s] = self.enter(Observation(
-                    path=self.path / 'observations' / f'observation_{s}'
-                ))
+                paths[s] = self.path / 'observations' / f'observation_{s}'
+
+        # Load every asset the park is drawn with concurrently; the asset
+        # calls below then only look them up
+        for asset in self.assets.acquire_all([
+            (Terrain, self.path / 'park'),
+            (Terrain, self.path / 'earth'),
+            (Colormap, self.path / 'pink0'),
+            (Colormap, self.path / 'pink1'),
+            (Colormap, self.path / 'pink2'),
+            (Colormap, self.path / 'pink3'),
+            (Colormap, self.path / 'earth'),
+            (Observation, paths['0000172']),
+        ], workers=self.loaders):
+            self.defer(self.assets.release, asset)
+
+        self.paths = paths
 
 
         # self.observation = self.observations['0000341']
         # self.observation = self.observations['0000172']
         self.observation_id = '0000172'
-        self.observation = self.observations['0000172']
+        self.observation = self.observations.acquire(paths['0000172'])
+        self.defer(self.observations.release, self.observation)
         environment = self.enter(Environment(
-                terrain=self.enter(Terrain(
-                    path=self.path / 'park',
-                )),
+                terrain=self.asset(Terrain,
+                    self.path / 'park',
+                ),
                 colormaps=[
-                    self.enter(Colormap(
-                        path=self.path / 'pink0',
-                    )),
-                    self.enter(Colormap(
-                        path=self.path / 'pink1',
-                    )),
-                    self.enter(Colormap(
-                        path=self.path / 'pink2',
-                    )),
-                    self.enter(Colormap(
-                        path=self.path / 'pink3',
-                    )),
+                    self.asset(Colormap,
+                        self.path / 'pink0',
+                    ),
+                    self.asset(Colormap,
+                        self.path / 'pink1',
+                    ),
+                    self.asset(Colormap,
+                        self.path / 'pink2',
+                    ),
+                    self.asset(Colormap,
+                        self.path / 'pink3',
+                    ),
                 ],
             observation=self.observation
 #            observation=self.enter(Observation(
@@ -718,13 +877,13 @@ class Park(WithExitStackMixin):
         ))
 
         earth = self.enter(Environment(
-            terrain=self.enter(Terrain(
-                path=self.path / 'earth',
-            )),
+            terrain=self.asset(Terrain,
+                self.path / 'earth',
+            ),
             colormaps=[
-                self.enter(Colormap(
-                    path=self.path / 'earth',
-                )),
+                self.asset(Colormap,
+                    self.path / 'earth',
+                ),
             ],
             observation=None,
         ))
@@ -739,9 +898,13 @@ class Park(WithExitStackMixin):
         self.defer(lib.ospRelease, instances)
 
         self.environment = environment
+        self.earth = earth
         self.instances_ = instances_
         self.instances = instances
 
+        # The cached models use the shared observations, so they go first
+        self.defer(self.close_models)
+
     def update_observation(self, obs_id: str):
 #        if self.observation is not None:
 #            self.observation.close()
@@ -749,13 +912,33 @@ class Park(WithExitStackMixin):
 #        self.observation=self.enter(Observation(
 #            path=self.path / 'observation_0000341'
 #        ))
+        # Switching to an observation seen recently only swaps which
+        # instance array the world uses
         if self.observation_id != obs_id:
-            print(f"{self.observation_id} != {obs_id}")
+            logger.debug(event='observation_switch', previous=self.observation_id, observation=obs_id)
+            model = self.models.pop(obs_id, None)
+            if model is None:
+                model = ObservationModel(
+                    environment=self.environment,
+                    observations=self.observations,
+                    path=self.paths[obs_id],
+                    others=[self.earth.instance],
+                )
+                model.make()
+
+            self.models[obs_id] = model
+            while len(self.models) > self.capacity:
+                _id, evicted = self.models.popitem(last=False)
+                evicted.close()
+
             self.observation_id = obs_id
-            self.observation = self.observations[obs_id]
-            self.environment.update_index(self.observation.index)
-        else:
-            print("SAME ID")
+            self.observation = model.observation
+            self.instances = model.instances
+
+    def close_models(self):
+        while self.models:
+            _id, model = self.models.popitem()
+            model.close()
 
 
 class Ambient(WithExitStackMixin):
@@ -897,26 +1080,88 @@ class Sunlight(WithExitStackMixin):
         /,
         *,
         alt: float,
-        planets=skyfield.api.load('de421.bsp'),
-        timescale=skyfield.api.load.timescale(),
         cls=sunrise.model.Location,
     ):
-        sun = planets['sun']
-        earth = planets['earth']
+        return sunrise.model.location_from_datetime(when, alt=alt, cls=cls)
+
+class LightCache:
+    """Committed Sunlight objects, least recently used evicted first.
+
+    Lights are keyed by their hour quantized to 1/hour_resolution of an
+    hour, their type and intensity, and their sky vector normalized and
+    rounded to sky_digits, so nearby requests share one skyfield lookup
+    and one OSPRay light. Evicted lights are closed, which releases our
+    reference; OSPRay keeps them alive while a light array still uses them.
+    """
+
+    def __init__(self, *, capacity: int, hour_resolution: int, sky_digits: int):
+        self.capacity = capacity
+        self.hour_resolution = hour_resolution
+        self.sky_digits = sky_digits
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lights = collections.OrderedDict()
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._lights
+
+    def key(self, hour: float, light_type: str, intensity: float, sky) -> tuple:
+        hour = round(hour * self.hour_resolution) / self.hour_resolution
+        if sky is not None:
+            norm = math.sqrt(sum(x * x for x in sky)) or 1.0
+            sky = tuple(round(x / norm, self.sky_digits) for x in sky)
+        return (hour, light_type, intensity, sky)
+
+    def get(self, hour: float, light_type: str, intensity: float, sky=None) -> Sunlight:
+        key = self.key(hour, light_type, intensity, sky)
+        sunlight = self._lights.get(key)
+        if sunlight is not None:
+            self.hits += 1
+            self._lights.move_to_end(key)
+            return sunlight
+
+        self.misses += 1
+        hour, light_type, intensity, sky = key
+        sunlight = Sunlight(
+            now=(
+                datetime.datetime(year=2023, month=6, day=1, hour=0, tzinfo=datetime.timezone(
+                    offset=datetime.timedelta(hours=0),  # Eastern Time
+                    # offset=datetime.timedelta(hours=-5),  # Eastern Time
+                    name='EST'
+                ))
+                + 
+                datetime.timedelta(hours=hour)
+            ),
+            light_type=light_type,
+            intensity=intensity,
+            sky=(0,0,0) if sky is None else sky,
+        )
+        sunlight.make()
 
-        now = timescale.from_datetime(when)
-        position = earth.at(now).observe(sun).apparent()
+        self._lights[key] = sunlight
+        while len(self._lights) > self.capacity:
+            _key, evicted = self._lights.popitem(last=False)
+            self.evictions += 1
+            evicted.close()
 
-        location = skyfield.toposlib.wgs84.geographic_position_of(position)
-        lat = location.latitude.degrees
-        lng = location.longitude.degrees
+        return sunlight
 
-        return cls(
-            lat=lat,
-            lng=lng,
-            alt=alt,
+    def close(self):
+        while self._lights:
+            _key, sunlight = self._lights.popitem()
+            sunlight.close()
+
+    def stats(self) -> dict:
+        return dict(
+            lights=len(self._lights),
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
         )
 
+
 class HDRI(WithExitStackMixin):
     def __init__(self, path):
         super().__init__()
@@ -955,11 +1200,120 @@ class HDRI(WithExitStackMixin):
 
 
 
+class FrameBufferPool:
+    """Idle framebuffers of one Scene, reused across requests.
+
+    Framebuffers are keyed by everything they are created with, so a
+    request only allocates (and attaches the image operations to) a new
+    one for a size it has not seen recently. Idle framebuffers beyond
+    `capacity` bytes are released least recently used first.
+    """
+
+    def __init__(self, *, capacity: int):
+        self.capacity = capacity
+
+        # Approximate bytes per pixel of each format and extra channel
+        self.format_bytes = {
+            lib.OSP_FB_RGBA8: 4,
+            lib.OSP_FB_SRGBA: 4,
+            lib.OSP_FB_RGBA32F: 16,
+        }
+        self.channel_bytes = {
+            lib.OSP_FB_DEPTH: 4,
+            lib.OSP_FB_ACCUM: 16,
+            lib.OSP_FB_VARIANCE: 16,
+            lib.OSP_FB_NORMAL: 12,
+            lib.OSP_FB_ALBEDO: 12,
+        }
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._idle = collections.OrderedDict()
+        self._keys = {}
+
+    def size(self, key) -> int:
+        width, height, format, channels, _imageops = key
+        bpp = self.format_bytes.get(format, 16)
+        for channel, nbytes in self.channel_bytes.items():
+            if channels & channel:
+                bpp += nbytes
+        return width * height * bpp
+
+    def acquire(self, width: int, height: int, format: int, channels: int, imageops) -> lib.OSPFrameBuffer:
+        key = (width, height, format, channels, ctypes.cast(imageops, ctypes.c_void_p).value)
+        framebuffer = self._idle.pop(key, None)
+        if framebuffer is not None:
+            self.hits += 1
+            self.bytes -= self.size(key)
+            lib.ospResetAccumulation(framebuffer)
+
+        else:
+            self.misses += 1
+            framebuffer = lib.ospNewFrameBuffer(width, height, format, channels)
+            if imageops is not None:
+                lib.ospSetObject(framebuffer, b'imageOperation', imageops)
+            lib.ospCommit(framebuffer)
+
+        self._keys[ctypes.cast(framebuffer, ctypes.c_void_p).value] = key
+        return framebuffer
+
+    def release(self, framebuffer: lib.OSPFrameBuffer):
+        key = self._keys.pop(ctypes.cast(framebuffer, ctypes.c_void_p).value)
+        size = self.size(key)
+        if key in self._idle or size > self.capacity:
+            lib.ospRelease(framebuffer)
+            return
+
+        self._idle[key] = framebuffer
+        self.bytes += size
+        while self.bytes > self.capacity:
+            key, framebuffer = self._idle.popitem(last=False)
+            self.bytes -= self.size(key)
+            self.evictions += 1
+            lib.ospRelease(framebuffer)
+
+    def close(self):
+        while self._idle:
+            _key, framebuffer = self._idle.popitem()
+            lib.ospRelease(framebuffer)
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        return dict(
+            idle=len(self._idle),
+            bytes=self.bytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+
+# What the lights of a Scene are made from; the sky light is oriented by
+# the camera position
+def lights_of(request: model.RenderingRequest) -> tuple:
+    return (request.hour, request.light, request.position if request.light == 'sunSky' else None)
+
+
 class Scene(WithExitStackMixin):
-    def __init__(self, what: City | Park,):
+    def __init__(
+        self,
+        what: City | Park,
+        assets: sunrise.assets.Assets | None=None,
+        empty: typing.Callable[..., np.ndarray] | None=None,
+    ):
         super().__init__()
 
+        if assets is None:
+            assets = sunrise.assets.registry
+        if empty is None:
+            empty = np.empty
+
         self.what = what
+        self.assets = assets
+        # Allocates the arrays frames are read out into
+        self.empty = empty
         self.config = {}
 
     # Set the configuration of the renderer
@@ -976,9 +1330,10 @@ class Scene(WithExitStackMixin):
         point = self.enter(Point(
         ))
 
-        hdri = self.enter(HDRI(
-            path=auto.pathlib.Path('data/space/OSPTexture.texture2d.data.vec2f.bin')
-        ))
+        hdri = self.assets.acquire(HDRI,
+            auto.pathlib.Path('data/space/OSPTexture.texture2d.data.vec2f.bin')
+        )
+        self.defer(self.assets.release, hdri)
 
         sunlight = self.enter(Sunlight(
             now=(
@@ -1007,14 +1362,32 @@ class Scene(WithExitStackMixin):
         lib.ospCommit(self.imageops)
         self.defer(lib.ospRelease, self.imageops)
 
+        # Framebuffer channels needed to accumulate passes and estimate
+        # their variance
+        self.accumulate = lib.OSP_FB_COLOR | lib.OSP_FB_ACCUM | lib.OSP_FB_VARIANCE
+
+        self.framebuffers = FrameBufferPool(
+            capacity=self.config.renderer.framebuffer_bytes(),
+        )
+        self.defer(self.framebuffers.close)
+
+        self.light_cache = LightCache(
+            capacity=self.config.lights.cache(),
+            hour_resolution=self.config.lights.hour_resolution(),
+            sky_digits=self.config.lights.sky_digits(),
+        )
+        self.defer(self.light_cache.close)
+
+        # The light array keeps its identity; update_lights copies the
+        # current lights into it
         lights = Data([
             # ambient.light,
-            # distant.light,
+            distant.light,
             # point.light,
-            # sunlight.light,
+            sunlight.light,
             hdri.light,
         ], type=lib.OSP_LIGHT)
-        # self.defer(lib.ospRelease, lights)
+        self.defer(lib.ospRelease, lights)
 
         world = lib.ospNewWorld()
         self.defer(lib.ospRelease, world)
@@ -1061,85 +1434,119 @@ class Scene(WithExitStackMixin):
         self.sunlight = sunlight
         self.logger = None
         self.observation_id = ''
+        self.committed = {}
+        self.switch_ns = 0
+
+    # Remember what is committed to the OSPRay objects under `name`,
+    # returning whether `value` differs from it
+    def changed(self, name: str, value) -> bool:
+        if name in self.committed and self.committed[name] == value:
+            return False
+
+        self.committed[name] = value
+        return True
+
+    # Forget what was committed under `name` if updating it fails, so the
+    # next request tries again
+    @contextlib.contextmanager
+    def committing(self, name: str):
+        try:
+            yield
+        except BaseException:
+            self.committed.pop(name, None)
+            raise
+
+    # Update the aspect ratio of the camera dynamically; the caller commits
+    def update_camera(self, width, height) -> bool:
+        if not self.changed('aspect', width / height):
+            return False
 
-    # Update the aspect ratio of the camera dynamically
-    def update_camera(self, width, height):
         lib.ospSetFloat(self.camera, b'aspect', width / height)
-        lib.ospCommit(self.camera)
+        return True
 
     # Update the index material for the species that we want to view
     def update_observation(self, observation_id: str):
         index_start = time.time_ns()
 
         self.what.update_observation(observation_id)
+        lib.ospSetObject(self.world, b'instance', self.what.instances)
         
         index_time = time.time_ns() - index_start
+        self.switch_ns += index_time
         self.logger.info(event='observation_recreation_ns', time=index_time)
 
     def update_lights(self, hour: int):
         light_start = time.time_ns()
-        self.sunlight = self.enter(Sunlight(
-            now=(
-                datetime.datetime(year=2023, month=6, day=1, hour=0, tzinfo=datetime.timezone(
-                    offset=datetime.timedelta(hours=0),  # Eastern Time
-                    # offset=datetime.timedelta(hours=-5),  # Eastern Time
-                    name='EST'
-                ))
-                + 
-                datetime.timedelta(hours=hour)
-                # datetime.timedelta(hours=-15)
-            ),
-            light_type=self.request.light,
-            intensity=0.014,
-            sky=self.request.position
-        ))
-
+        self.sunlight = self.light_cache.get(
+            hour,
+            self.request.light,
+            0.014,
+            sky=self.request.position if self.request.light == 'sunSky' else None,
+        )
         
-        self.distant = self.enter(Sunlight(
-            now=(
-                datetime.datetime(year=2023, month=6, day=1, hour=0, tzinfo=datetime.timezone(
-                    offset=datetime.timedelta(hours=0),  # Eastern Time
-                    # offset=datetime.timedelta(hours=6),  # Eastern Time
-                    # offset=datetime.timedelta(hours=-5),  # Eastern Time
-                    name='EST'
-                ))
-                + 
-                datetime.timedelta(hours=hour)
-                # datetime.timedelta(hours=-15)
-            ),
-            light_type='distant',
-            intensity=3.0,
-            # light_type='distant',
-        ))
+        self.distant = self.light_cache.get(
+            hour,
+            'distant',
+            3.0,
+        )
 
-        lights = Data([
+        Copy([
             # self.ambient.light,
             self.distant.light,
             # point.light,
             self.sunlight.light,
             self.hdri.light,
-        ], type=lib.OSP_LIGHT)
+        ], type=lib.OSP_LIGHT, dst=self.lights)
         light_time = time.time_ns() - light_start
-        self.logger.info(event='light_recreation_ns', time=light_time)
-        return lights
-
-    def render(self, request: model.RenderingRequest):
-        render_start = time.time_ns()
+        self.switch_ns += light_time
+        self.logger.info(event='light_recreation_ns', time=light_time, **self.light_cache.stats())
+
+    # How much work bringing this Scene to the state of `request` takes, in
+    # SWITCH_COSTS units: 0 when its observation and lights are committed
+    # already, and less when they are cached than when they must be made
+    def switch_cost(self, request: model.RenderingRequest) -> int:
+        cost = 0
+        if self.committed.get('observation') != request.observation:
+            models = getattr(self.what, 'models', {})
+            path = getattr(self.what, 'paths', {}).get(request.observation)
+            if request.observation in models:
+                cost += SWITCH_COSTS['model']
+            elif path is not None and self.what.observations.loaded(path):
+                cost += SWITCH_COSTS['observation']
+            else:
+                cost += SWITCH_COSTS['load']
+
+        if self.committed.get('lights') != lights_of(request):
+            hour, light, sky = lights_of(request)
+            if self.light_cache.key(hour, light, 0.014, sky) in self.light_cache:
+                cost += SWITCH_COSTS['light']
+            else:
+                cost += SWITCH_COSTS['sunlight']
+
+        return cost
+
+    def prepare(self, request: model.RenderingRequest, *, channels: int | None=None):
+        # Consecutive requests usually differ only in their tile, so only the
+        # OSPRay objects whose inputs changed are updated and recommitted.
         self.request = request
         world = self.world
-        renderer = self.renderer
-        self.update_camera(request.width, request.height)
+        camera_dirty = self.update_camera(request.width, request.height)
         camera = self.camera
+        world_dirty = False
 
         id = self.request.observation 
-        self.update_observation(id)
+        if self.changed('observation', id):
+            with self.committing('observation'):
+                self.update_observation(id)
+            world_dirty = True
         
-        lib.ospRelease(self.lights)
-        self.lights = self.update_lights(request.hour)
-        lib.ospSetObject(world, b'light', self.lights)
-        lib.ospCommit(self.lights)
-        # self.defer(lib.ospRelease, lights)
-        lib.ospCommit(world)
+        if self.changed('lights', lights_of(request)):
+            with self.committing('lights'):
+                self.update_lights(request.hour)
+            world_dirty = True
+
+        if world_dirty:
+            lib.ospCommit(world)
 
             
         # lib.ospSetInt(renderer, b'pixelSamples', samples)
@@ -1151,12 +1558,14 @@ class Scene(WithExitStackMixin):
         # num_x_bins = 2
         # num_y_bins = 2
 
-        img_start_x, img_end_x = col_id / num_x_bins, (1+col_id) / num_x_bins
-        img_start_y, img_end_y = row_id / num_y_bins, (1+row_id) / num_y_bins
+        # The frame covers span[0] x span[1] tiles starting at this one
+        num_rows, num_cols = request.span
+
+        img_start_x, img_end_x = col_id / num_x_bins, (num_cols+col_id) / num_x_bins
+        img_start_y, img_end_y = row_id / num_y_bins, (num_rows+row_id) / num_y_bins
 
-        GHOST = 16
-        dx = (img_end_x - img_start_x) / request.width
-        dy = (img_end_y - img_start_y) / request.height
+        dx = (img_end_x - img_start_x) / request.frame_width
+        dy = (img_end_y - img_start_y) / request.frame_height
 
         img_start_x, img_end_x = img_start_x - GHOST * dx, img_end_x + GHOST * dx
         img_start_y, img_end_y = img_start_y - GHOST * dy, img_end_y + GHOST * dy
@@ -1172,119 +1581,245 @@ class Scene(WithExitStackMixin):
         # height = 1 / (2 ** zoom)
         # print(f'{px=}, {py=}, {pz=} {height=}')
 
-        lib.ospSetVec2f(camera, b'imageStart', *(
-            img_start_x, img_start_y
-            # 0.0 + (col_id / num_x_bins), 0.0 + (row_id / num_y_bins)
-            # 0.0 + (col / num_x_bins), 0.0 + (row / num_y_bins)
-            # 1.0, 0.0,  # flip x
-            # 0.0, 1.0,  # flip y
-            # 1.0, 1.0,  # flip x and y
-        ))
-        lib.ospSetVec2f(camera, b'imageEnd', *(
-            img_end_x, img_end_y
-            # 0.0 + ((1+col_id) / num_x_bins), 0.0 + ((1+row_id) / num_y_bins)
-            # 0.0 + ((1+col) / num_x_bins), 0.0 + ((1+row) / num_y_bins)
-            # 1.0, 1.0,  # flip none
-            # 0.0, 1.0  # flip x
-            # 1.0, 0.0,  # flip y
-            # 0.0, 0.0,  # flip x and y
-        ))
-#         lib.ospSetFloat(camera, b'height', *(
-#             height,
-#         ))
-        coef = 201.0
-        lib.ospSetVec3f(camera, b'position', *(
-            request.position
-            # camx, camy, camz,
-            # camx, camy, camz,
-            # px + coef, py + coef, pz + coef,
-            # -1700.0, -1400.0, -700.0
-        ))
-        lib.ospSetVec3f(camera, b'up', *(
-            request.up
-            # 0.0, 1.0, 0.0,  # y+ up
-            # 0.0, -1.0, 0.0,  # y- p
-            # 0.0, 0.0, 1.0,
-        ))
-        lib.ospSetVec3f(camera, b'direction', *(
-            request.direction
-            # dx, dy, dz,
-            # -1.0, -1.0, -1.0,
-            # -camx, -camy, -camz,
-            # -camx, -camy, -camz,
-        ))
-        lib.ospCommit(camera)
-
-        framebuffer = lib.ospNewFrameBuffer(
-            request.width + 2 * GHOST,
-            request.height + 2 * GHOST,
+        view = (
+            (img_start_x, img_start_y),
+            (img_end_x, img_end_y),
+            request.position,
+            request.up,
+            request.direction,
+        )
+        if self.changed('view', view):
+            camera_dirty = True
+
+            lib.ospSetVec2f(camera, b'imageStart', *(
+                img_start_x, img_start_y
+                # 0.0 + (col_id / num_x_bins), 0.0 + (row_id / num_y_bins)
+                # 0.0 + (col / num_x_bins), 0.0 + (row / num_y_bins)
+                # 1.0, 0.0,  # flip x
+                # 0.0, 1.0,  # flip y
+                # 1.0, 1.0,  # flip x and y
+            ))
+            lib.ospSetVec2f(camera, b'imageEnd', *(
+                img_end_x, img_end_y
+                # 0.0 + ((1+col_id) / num_x_bins), 0.0 + ((1+row_id) / num_y_bins)
+                # 0.0 + ((1+col) / num_x_bins), 0.0 + ((1+row) / num_y_bins)
+                # 1.0, 1.0,  # flip none
+                # 0.0, 1.0  # flip x
+                # 1.0, 0.0,  # flip y
+                # 0.0, 0.0,  # flip x and y
+            ))
+#             lib.ospSetFloat(camera, b'height', *(
+#                 height,
+#             ))
+            coef = 201.0
+            lib.ospSetVec3f(camera, b'position', *(
+                request.position
+                # camx, camy, camz,
+                # camx, camy, camz,
+                # px + coef, py + coef, pz + coef,
+                # -1700.0, -1400.0, -700.0
+            ))
+            lib.ospSetVec3f(camera, b'up', *(
+                request.up
+                # 0.0, 1.0, 0.0,  # y+ up
+                # 0.0, -1.0, 0.0,  # y- p
+                # 0.0, 0.0, 1.0,
+            ))
+            lib.ospSetVec3f(camera, b'direction', *(
+                request.direction
+                # dx, dy, dz,
+                # -1.0, -1.0, -1.0,
+                # -camx, -camy, -camz,
+                # -camx, -camy, -camz,
+            ))
+        if camera_dirty:
+            lib.ospCommit(camera)
+
+        framebuffer = self.framebuffers.acquire(
+            request.frame_width + 2 * GHOST,
+            request.frame_height + 2 * GHOST,
             (
                 # lib.OSP_FB_RGBA8
+                lib.OSP_FB_RGBA32F if request.dtype == 'float32' else
                 lib.OSP_FB_SRGBA
             ),
-            lib.OSP_FB_COLOR,
+            lib.OSP_FB_COLOR if channels is None else channels,
+            self.imageops,
         )
 
-        lib.ospSetObject(framebuffer, b'imageOperation', self.imageops)
-        lib.ospCommit(framebuffer)
+        return framebuffer
 
-        _variance: float = lib.ospRenderFrameBlocking(
-            framebuffer,
-            self.renderer,
-            self.camera,
-            self.world,
-        )
+    # Read the color channel back as a NumPy view of the mapped framebuffer;
+    # the ghost border is cropped by slicing, so the only copy made is the
+    # contiguous array handed to the encoder.
+    def readout(self, framebuffer, request: model.RenderingRequest):
+        width = request.frame_width + 2*GHOST
+        height = request.frame_height + 2*GHOST
+
+        ctype = ctypes.c_float if request.dtype == 'float32' else ctypes.c_uint8
 
         rgba = lib.ospMapFrameBuffer(framebuffer, lib.OSP_FB_COLOR)
         encoding_start = time.time_ns()
-        image = PIL.Image.frombytes(
-            'RGBA',
-            (request.width + 2*GHOST, request.height + 2*GHOST),
-            ctypes.string_at(rgba, size=((request.width + 2*GHOST)* (request.height + 2*GHOST) * 4)),
-            'raw',
-            'RGBA',
-            0,
-            1,
-        )
-        w, h = image.size
-        print(f'W: {w}, H: {h}')
-        image.load()
+        try:
+            mapped = np.ctypeslib.as_array(
+                ctypes.cast(rgba, ctypes.POINTER(ctype)),
+                shape=(height, width, 4),
+            )
+            # The one copy out of the framebuffer, straight into an array
+            # the encoders can read
+            pixels = self.empty((height - 2*GHOST, width - 2*GHOST, 4), dtype=mapped.dtype)
+            np.copyto(pixels, mapped[GHOST:height-GHOST, GHOST:width-GHOST])
+        finally:
+            lib.ospUnmapFrameBuffer(rgba, framebuffer)
         encoding_time = time.time_ns() - encoding_start
         self.logger.info(event='encoding_time_ns', time=encoding_time, dimension=[request.width, request.height])
-#        cv_img = cv.cvtColor(np.array(image), cv.COLOR_RGB2BGR)
+#        cv_img = cv.cvtColor(pixels, cv.COLOR_RGBA2BGR)
 #        kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
 #        sharpened = cv.filter2D(cv_img, -1, kernel)
-#        image = PIL.Image.fromarray(sharpened)
 
-        lib.ospUnmapFrameBuffer(rgba, framebuffer)
+        return sunrise.model.RenderingResponse(
+            pixels=pixels,
+        )
 
-        lib.ospRelease(framebuffer)
+    def render(self, request: model.RenderingRequest):
+        render_start = time.time_ns()
+        framebuffer = self.prepare(request)
+
+        _variance: float = lib.ospRenderFrameBlocking(
+            framebuffer,
+            self.renderer,
+            self.camera,
+            self.world,
+        )
+
+        response = self.readout(framebuffer, request)
+        self.framebuffers.release(framebuffer)
 
         time_rendering = time.time_ns() - render_start
         self.logger.info(event='rendering_time_ns', time=time_rendering, dimension=[request.width, request.height])
-        image = image.crop((
-            GHOST,
-            GHOST,
-            w - GHOST,
-            h - GHOST,
+        return response
+
+    # Prepare in the default executor: switching observations reads from
+    # disk and commits geometry, which must not hold up the event loop. The
+    # Scene is still being changed until prepare returns, so that is waited
+    # for even if we are cancelled meanwhile.
+    async def aprepare(self, request: RenderingRequest, *, channels: int | None=None):
+        loop = auto.asyncio.get_running_loop()
+        preparing = loop.run_in_executor(None, functools.partial(
+            self.prepare,
+            request,
+            channels=channels,
         ))
-        w, h = image.size
-        print(f'After Crop: W: {w}, H: {h}')
-
-        return sunrise.model.RenderingResponse(
-            image=image,
+        cancelled = False
+        while not preparing.done():
+            try:
+                await auto.asyncio.shield(preparing)
+            except auto.asyncio.CancelledError:
+                cancelled = True
+
+        if cancelled:
+            if preparing.exception() is None:
+                self.framebuffers.release(preparing.result())
+            raise auto.asyncio.CancelledError()
+
+        return preparing.result()
+
+    # Render one frame into the framebuffer without blocking the event loop:
+    # the frame is submitted with ospRenderFrame and its future is polled
+    # from the loop, so no thread is started per request. Cancelling the
+    # awaiting task cancels the frame.
+    async def aframe(self, framebuffer) -> float:
+        future = lib.ospRenderFrame(
+            framebuffer,
+            self.renderer,
+            self.camera,
+            self.world,
         )
+        try:
+            await Wait(future)
+
+        except auto.asyncio.CancelledError:
+            # Stop tracing tiles nobody will look at. The tiles already in
+            # flight still write to the framebuffer, so it is only handed
+            # back once the frame is idle; that wait polls like any other
+            # and is not given up if we are cancelled again meanwhile.
+            lib.ospCancel(future)
+            idle = auto.asyncio.ensure_future(Wait(future))
+            while not idle.done():
+                try:
+                    await auto.asyncio.shield(idle)
+                except auto.asyncio.CancelledError:
+                    pass
+
+            self.logger.info(event='rendering_cancelled')
+            raise
+
+        finally:
+            lib.ospRelease(future)
+
+        return lib.ospGetVariance(framebuffer)
+
+    async def arender(self, request: RenderingRequest, logger) -> RenderingResponse:
+        self.logger = logger
+        render_start = time.time_ns()
+        if request.variance is None and (request.passes or 1) == 1:
+            framebuffer = await self.aprepare(request)
+        else:
+            framebuffer = await self.aprepare(request, channels=self.accumulate)
+
+        try:
+            passes = 0
+            for passes in range(1, (request.passes or 1) + 1):
+                variance = await self.aframe(framebuffer)
+                if request.variance is not None and variance <= request.variance:
+                    break
+
+            response = self.readout(framebuffer, request)
+            response.variance = variance
+            response.passes = passes
+        finally:
+            self.framebuffers.release(framebuffer)
 
-    def arender(self, request: RenderingRequest, logger) -> auto.asyncio.Future[RenderingResponse]:
+        time_rendering = time.time_ns() - render_start
+        self.logger.info(event='rendering_time_ns', time=time_rendering, passes=passes, variance=variance, dimension=[request.width, request.height])
+        return response
+
+    # Progressively refine one view: every pass adds samples to an
+    # accumulation framebuffer and yields the image so far, so the first
+    # (noisy) image is available after a single pass. Stops early once the
+    # request's target variance is reached.
+    async def aprogressive(
+        self,
+        request: RenderingRequest,
+        logger,
+        *,
+        passes: int,
+    ) -> typing.AsyncGenerator[tuple[int, float, RenderingResponse], None]:
         self.logger = logger
-        future = auto.asyncio.Future()
+        render_start = time.time_ns()
+        framebuffer = await self.aprepare(request, channels=self.accumulate)
+        lib.ospResetAccumulation(framebuffer)
 
-        thread = auto.threading.Thread(
-            target=lambda: future.set_result(self.render(request)),
-        )
-        thread.start()
+        try:
+            for index in range(passes):
+                variance = await self.aframe(framebuffer)
+                response = self.readout(framebuffer, request)
+                response.variance = variance
+                response.passes = index + 1
+                if index == 0:
+                    time_first = time.time_ns() - render_start
+                    self.logger.info(event='first_pass_time_ns', time=time_first, dimension=[request.width, request.height])
+
+                yield index, variance, response
 
-        return future
+                if request.variance is not None and variance <= request.variance:
+                    break
+
+        finally:
+            self.framebuffers.release(framebuffer)
+
+        time_rendering = time.time_ns() - render_start
+        self.logger.info(event='progressive_time_ns', time=time_rendering, passes=index + 1, dimension=[request.width, request.height])
 
 
 def Render(
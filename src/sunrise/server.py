@@ -7,6 +7,15 @@ from ._auto import auto
 from . import scene
 from . import model
 from . import config as conf
+from . import pool
+from . import session as session_
+from . import ephemeris
+from . import assets
+from . import cache
+from . import encode
+from . import flight
+from . import coalesce
+from . import fair
 from fastapi.middleware.cors import CORSMiddleware
 import json
 import asyncio
@@ -135,6 +144,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Sunrise-Variance",
+        "X-Sunrise-Passes",
+        "ETag",
+    ],
 )
 
 # Read the configuration from the "config.toml" file 
@@ -165,12 +179,12 @@ SUNRISE_SCENE_PATH = auto.os.environ['SUNRISE_SCENE_PATH']
 
 
 # @auto.functools.cache
-async def get_scene(
+async def get_scenes(
     config: auto.typing.Annotated[
         auto.typing.Any,
         auto.fastapi.Depends(get_config),
     ],
-) -> auto.typing.Generator[scene.Scene, None, None]:
+) -> pool.ScenePool:
     global lib
     try:
         lib
@@ -189,33 +203,128 @@ async def get_scene(
     try:
         scenes
     except NameError:
-        scenes = auto.asyncio.Queue()
+        startup = auto.time.perf_counter_ns()
+        ephemeris.load(
+            start=config.ephemeris.start(),
+            days=config.ephemeris.days(),
+            resolution=config.ephemeris.resolution(),
+            cache=config.ephemeris.cache(),
+        )
+
 #        what = scene.Park(
 #            path=auto.pathlib.Path('data'),
 #        )
 #        what.make()
 
-        for _ in range(6):
+        scenes_ = []
+        for _ in range(config.renderer.workers()):
             what = scene.Park(
                 path=auto.pathlib.Path('data'),
+                models=config.park.models(),
+                observations=get_observations(),
+                loaders=config.park.loaders(),
             )
             what.make()
             scene_ = scene.Scene(
                 what=what,
+                empty=get_encoder().empty,
             )
             scene_.configure(config)
             scene_.make()
 
-            scenes.put_nowait(scene_)
+            scenes_.append(scene_)
+
+        scenes = pool.ScenePool(
+            scenes_,
+            queue=config.renderer.queue(),
+            aging=config.renderer.aging(),
+        )
+        for row in assets.registry.report:
+            custom_logger.info(event='asset_loaded', **row)
+        custom_logger.info(event='startup_report', startup_time=auto.time.perf_counter_ns() - startup, **assets.registry.stats())
     
-    scene_ = None
+    return scenes
+
+
+# The 503 we answer with when the render queue is full
+def unavailable(scenes: pool.ScenePool, config) -> auto.fastapi.HTTPException:
+    custom_logger.warning(event='render_queue_full', **scenes.stats())
+    return auto.fastapi.HTTPException(
+        status_code=503,
+        detail='Render queue is full',
+        headers={
+            'Retry-After': str(config.renderer.retry_after()),
+        },
+    )
+
+
+# Check a Scene out of the pool, answering 503 when the queue is full
+@auto.contextlib.asynccontextmanager
+async def checkout(scenes: pool.ScenePool, config, priority: int=pool.PRIORITIES['final'], request=None):
     try:
-        scene_ = await scenes.get()
-        yield scene_
+        async with scenes.checkout(priority, request) as scene_:
+            yield scene_
 
-    finally:
-        if scene_ is not None:
-            scenes.put_nowait(scene_)
+    except pool.PoolFull:
+        raise unavailable(scenes, config)
+
+
+# Renders in flight per client session, so newer camera moves cancel older ones
+sessions = session_.Sessions()
+
+# Identical renders in flight, so concurrent requests for the same view
+# share one Scene and one render
+flights = flight.SingleFlight()
+
+
+# Observations loaded for every Park, within one budget for the process
+@auto.functools.cache
+def get_observations() -> scene.Observations:
+    config = get_config()
+    return scene.Observations(
+        capacity=config.park.observation_bytes(),
+        assets=assets.registry,
+    )
+
+
+# Sibling tiles of one view that arrive together, rendered as one frame
+@auto.functools.cache
+def get_frames() -> coalesce.FrameCoalescer:
+    config = get_config()
+    return coalesce.FrameCoalescer(
+        window=config.renderer.coalesce_window(),
+        max_tiles=config.renderer.coalesce_tiles(),
+    )
+
+
+# Render time used per client, so one client playing an animation cannot
+# keep every Scene busy while other clients' tiles wait
+@auto.functools.cache
+def get_budgets() -> fair.RenderBudgets:
+    config = get_config()
+    return fair.RenderBudgets(
+        seconds=config.fairness.seconds(),
+        window=config.fairness.window(),
+    )
+
+
+# Whom render time is charged to: the client's address, which unlike the
+# session parameter a client cannot pick anew for every request. Behind a
+# trusted proxy (server.proxies) uvicorn sets it from X-Forwarded-For.
+def client_of(connection: auto.fastapi.Request | auto.fastapi.WebSocket) -> str:
+    return connection.client.host if connection.client else ''
+
+
+# Encoded tiles shared by every client, so a view someone already looked
+# at is answered without rendering it again
+@auto.functools.cache
+def get_tiles() -> cache.TileCache:
+    config = get_config()
+    return cache.TileCache(
+        config.cache.bytes(),
+        position_digits=config.cache.position_digits(),
+        hour_digits=config.cache.hour_digits(),
+    )
 
 
 @app.get('/')
@@ -295,21 +404,16 @@ async def config(
     )
 
 
-@app.get('/api/v1/view/')
-async def view(
+# Parse the camera, lighting, and tile parameters shared by the
+# rendering endpoints
+async def get_rendering_request(
     *,
-
-    scene: auto.typing.Annotated[
-        scene.Scene,
-        auto.fastapi.Depends(get_scene),
-    ],
-
     tile: auto.typing.Annotated[
         str,
         auto.fastapi.Query(
             alias='tile',
         ),
-    ],
+    ] = '0of1,0of1',
 
     position: auto.typing.Annotated[
         str,
@@ -370,13 +474,43 @@ async def view(
             alias='observation',
         ),
     ],
-):
+
+    variance: auto.typing.Annotated[
+        float | None,
+        auto.fastapi.Query(
+            alias='variance',
+            gt=0.0,
+        ),
+    ] = None,
+    passes: auto.typing.Annotated[
+        int | None,
+        auto.fastapi.Query(
+            alias='passes',
+            ge=1,
+        ),
+    ] = None,
+    dtype: auto.typing.Annotated[
+        auto.typing.Literal['uint8', 'float32'],
+        auto.fastapi.Query(
+            alias='dtype',
+        ),
+    ] = 'uint8',
+
+    config: auto.typing.Annotated[
+        auto.typing.Any,
+        auto.fastapi.Depends(get_config),
+    ],
+) -> model.RenderingRequest:
     tile = tuple(map(str, tile.split(',')))
     position = tuple(map(float, position.split(',')))
     direction = tuple(map(float, direction.split(',')))
     up = tuple(map(float, up.split(',')))
+    if passes is not None:
+        passes = min(passes, config.renderer.max_passes())
+    elif variance is not None:
+        passes = config.renderer.max_passes()
 
-    response = await scene.arender(model.RenderingRequest(
+    return model.RenderingRequest(
         width=width,
         height=height,
         tile=tile,
@@ -386,17 +520,722 @@ async def view(
         samples=samples,
         hour=hour,
         light=light,
-        observation=observation
-    ), custom_logger)
-    
-    with auto.io.BytesIO() as f:
-        response.image.save(f, 'PNG')
+        observation=observation,
+        variance=variance,
+        passes=passes,
+        dtype=dtype,
+    )
+
+
+# The encoder every endpoint turns pixels into images with
+@auto.functools.cache
+def get_encoder() -> encode.Encoder:
+    config = get_config()
+    encoder = encode.Encoder(
+        png_level=config.encoding.png_level(),
+        png_alpha=config.encoding.png_alpha(),
+        jpeg_quality=config.encoding.jpeg_quality(),
+        webp_quality=config.encoding.webp_quality(),
+        webp_lossless=config.encoding.webp_lossless(),
+        raw_level=config.encoding.raw_level(),
+        workers=config.encoding.workers(),
+    )
+    auto.atexit.register(encoder.close)
+    return encoder
+
+
+# Pick the image format from the "format" parameter or the Accept header
+async def get_format(
+    *,
+    request: auto.typing.Annotated[
+        model.RenderingRequest,
+        auto.fastapi.Depends(get_rendering_request),
+    ],
+    format: auto.typing.Annotated[
+        auto.typing.Literal['png', 'jpeg', 'webp', 'raw'] | None,
+        auto.fastapi.Query(
+            alias='format',
+        ),
+    ] = None,
+    accept: auto.typing.Annotated[
+        str | None,
+        auto.fastapi.Header(
+            alias='Accept',
+        ),
+    ] = None,
+) -> str:
+    format = encode.negotiate(format, accept)
+    if format is None:
+        raise auto.fastapi.HTTPException(
+            status_code=406,
+            detail='None of the accepted media types can be rendered',
+        )
+    if request.dtype != 'uint8' and format != 'raw':
+        raise auto.fastapi.HTTPException(
+            status_code=400,
+            detail=f'dtype={request.dtype} needs format=raw',
+        )
+
+    return format
+
+
+# How urgently a render is needed: the named priority if there is one,
+# otherwise interactive for renders as small as a drag preview
+def prioritize(request: model.RenderingRequest, priority: str | None, config) -> int:
+    if priority is not None:
+        return pool.PRIORITIES[priority]
+
+    rows, cols = request.span
+    pixels = request.width * (request.height or request.width) * rows * cols
+    if pixels * request.samples * (request.passes or 1) <= config.renderer.interactive_pixels():
+        return pool.PRIORITIES['interactive']
+
+    return pool.PRIORITIES['final']
+
+
+# The priority of a render from the "priority" parameter or its size
+async def get_priority(
+    *,
+    request: auto.typing.Annotated[
+        model.RenderingRequest,
+        auto.fastapi.Depends(get_rendering_request),
+    ],
+    priority: auto.typing.Annotated[
+        auto.typing.Literal['interactive', 'final', 'animation'] | None,
+        auto.fastapi.Query(
+            alias='priority',
+        ),
+    ] = None,
+    config: auto.typing.Annotated[
+        auto.typing.Any,
+        auto.fastapi.Depends(get_config),
+    ],
+) -> int:
+    return prioritize(request, priority, config)
+
+
+@app.get('/api/v1/view/')
+async def view(
+    *,
+
+    scenes: auto.typing.Annotated[
+        pool.ScenePool,
+        auto.fastapi.Depends(get_scenes),
+    ],
+    config: auto.typing.Annotated[
+        auto.typing.Any,
+        auto.fastapi.Depends(get_config),
+    ],
+    tiles: auto.typing.Annotated[
+        cache.TileCache,
+        auto.fastapi.Depends(get_tiles),
+    ],
+    frames: auto.typing.Annotated[
+        coalesce.FrameCoalescer,
+        auto.fastapi.Depends(get_frames),
+    ],
+    encoder: auto.typing.Annotated[
+        encode.Encoder,
+        auto.fastapi.Depends(get_encoder),
+    ],
+    format: auto.typing.Annotated[
+        str,
+        auto.fastapi.Depends(get_format),
+    ],
+    budgets: auto.typing.Annotated[
+        fair.RenderBudgets,
+        auto.fastapi.Depends(get_budgets),
+    ],
+    http_request: auto.fastapi.Request,
+
+    request: auto.typing.Annotated[
+        model.RenderingRequest,
+        auto.fastapi.Depends(get_rendering_request),
+    ],
+
+    if_none_match: auto.typing.Annotated[
+        str | None,
+        auto.fastapi.Header(
+            alias='If-None-Match',
+        ),
+    ] = None,
+    compress: auto.typing.Annotated[
+        bool,
+        auto.fastapi.Query(
+            alias='compress',
+        ),
+    ] = False,
+    priority: auto.typing.Annotated[
+        auto.typing.Literal['interactive', 'final', 'animation'] | None,
+        auto.fastapi.Query(
+            alias='priority',
+        ),
+    ] = None,
+    session: auto.typing.Annotated[
+        str | None,
+        auto.fastapi.Query(
+            alias='session',
+        ),
+    ] = None,
+    sequence: auto.typing.Annotated[
+        int,
+        auto.fastapi.Query(
+            alias='sequence',
+        ),
+    ] = 0,
+):
+    key = tiles.key(request, format, compress and format == 'raw')
+    entry = tiles.get(key)
+    if entry is None:
+        # A frame, possibly spanning sibling tiles of other requests, each
+        # owned by a (client, priority) pair. It goes at the most urgent
+        # priority any of them asks for or its whole size earns, is only
+        # demoted when every client it is for is over budget, and its time
+        # is split between their requests.
+        async def render(frame: model.RenderingRequest, owners: list[tuple[str, str | None]]):
+            clients = [client for client, _ in owners]
+
+            async def render():
+                rank = min((
+                    prioritize(frame, priority, config)
+                    for _, priority in owners
+                ), default=prioritize(frame, None, config))
+                if clients and all(budgets.over(client) for client in clients):
+                    rank = budgets.demote(clients[0], rank)
+                reserved = [budgets.reserve(client) for client in clients]
+
+                start = None
+                try:
+                    async with checkout(scenes, config, rank, frame) as scene_:
+                        start = auto.time.perf_counter()
+                        return await scene_.arender(frame, custom_logger)
+
+                finally:
+                    if start is None:
+                        for client, seconds in zip(clients, reserved):
+                            budgets.refund(client, seconds)
+                    else:
+                        share = (auto.time.perf_counter() - start) / max(len(clients), 1)
+                        for client, seconds in zip(clients, reserved):
+                            budgets.charge(client, share, reserved=seconds)
+
+            return await flights.do(tiles.key(frame), render)
+
+        try:
+            response = await session_.cancellable(
+                http_request,
+                frames.submit(request, render, owner=(client_of(http_request), priority)),
+                sessions=sessions,
+                session=session,
+                sequence=sequence,
+            )
+
+        except session_.Superseded:
+            return auto.fastapi.Response(status_code=409)
+
+        except session_.Cancelled:
+            # Nginx's "client closed request"; nobody is listening anyway
+            return auto.fastapi.Response(status_code=499)
+        
+        entry = tiles.put(
+            key,
+            await encoder.aencode(response.pixels, format, compress=compress),
+            media_type=encode.MEDIA_TYPES[format],
+            headers={
+                'X-Sunrise-Variance': str(response.variance),
+                'X-Sunrise-Passes': str(response.passes),
+            },
+        )
+
+    if cache.matches(if_none_match, entry.etag):
+        return auto.fastapi.Response(
+            status_code=304,
+            headers={
+                'ETag': entry.etag,
+                'Vary': 'Accept',
+            },
+        )
+
+    return auto.fastapi.Response(
+        content=entry.content,
+        media_type=entry.media_type,
+        headers={
+            **entry.headers,
+            'ETag': entry.etag,
+            'Vary': 'Accept',
+        },
+    )
+
+
+# Types of the fields of interactive messages, which are not converted
+# for us like query parameters are
+INTERACTIVE_FIELDS = dict(
+    tile=str,
+    position=str,
+    direction=str,
+    up=str,
+    width=int,
+    height=int,
+    samples=int,
+    hour=float,
+    light=str,
+    observation=str,
+    variance=float,
+    passes=int,
+    dtype=str,
+)
+
+
+# The observations the Parks of the pool can switch to
+def observation_ids(scenes: pool.ScenePool) -> set[str]:
+    return {
+        id
+        for scene_ in scenes.scenes
+        for id in scene_.what.paths
+    }
+
+
+# The rendering request of an interactive message, checked like the query
+# parameters of /api/v1/view/ are; raises ValueError for a bad message
+async def interactive_request(message: dict, config, observations: set[str]) -> model.RenderingRequest:
+    unknown = message.keys() - INTERACTIVE_FIELDS.keys()
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+
+    fields = {}
+    for name, value in message.items():
+        if value is None:
+            fields[name] = None
+        elif isinstance(value, list):
+            fields[name] = ','.join(map(str, value))
+        elif isinstance(value, (dict, bool)):
+            raise ValueError(f'Invalid {name}: {value!r}')
+        else:
+            fields[name] = INTERACTIVE_FIELDS[name](value)
+
+    if fields.get('variance') is not None and not fields['variance'] > 0.0:
+        raise ValueError('variance needs to be greater than 0')
+    if fields.get('passes') is not None and fields['passes'] < 1:
+        raise ValueError('passes needs to be at least 1')
+    if fields.get('dtype', 'uint8') not in ('uint8', 'float32'):
+        raise ValueError(f'Unsupported dtype: {fields["dtype"]!r}')
+    for name in ('width', 'height', 'samples'):
+        if fields.get(name) is not None and fields[name] < 1:
+            raise ValueError(f'{name} needs to be at least 1')
+    for name in ('position', 'direction', 'up', 'width', 'height', 'samples', 'hour', 'light', 'observation'):
+        if fields.get(name) is None:
+            raise ValueError(f'{name} is required')
+
+    # RofN,CofM: row R of N rows and column C of M columns
+    tile = fields.setdefault('tile', '0of1,0of1')
+    if tile is None:
+        raise ValueError('tile needs to be RofN,CofM')
+    try:
+        (row, rows), (col, cols) = [
+            map(int, part.split('of'))
+            for part in tile.split(',')
+        ]
+    except ValueError:
+        raise ValueError(f'Invalid tile: {tile!r}') from None
+    if not (0 <= row < rows and 0 <= col < cols):
+        raise ValueError(f'Invalid tile: {tile!r}')
+
+    if fields['observation'] not in observations:
+        raise ValueError(f'Unknown observation: {fields["observation"]!r}')
+
+    request = await get_rendering_request(config=config, **fields)
+    for name in ('position', 'direction', 'up'):
+        if len(getattr(request, name)) != 3:
+            raise ValueError(f'{name} needs 3 components')
+
+    return request
+
+
+# An interactive session over a WebSocket. The client sends JSON messages
+# with the same fields as /api/v1/view/ (plus "format", "priority" and
+# "sequence") whenever its camera or scene changes; the server renders
+# only the newest message it has not rendered yet and answers each frame
+# with a JSON header message followed by the image. Every frame checks a
+# Scene out of the pool like any other render, so idle sessions hold none.
+@app.websocket('/api/v1/interactive/')
+async def interactive(
+    *,
+
+    websocket: auto.fastapi.WebSocket,
+    scenes: auto.typing.Annotated[
+        pool.ScenePool,
+        auto.fastapi.Depends(get_scenes),
+    ],
+    config: auto.typing.Annotated[
+        auto.typing.Any,
+        auto.fastapi.Depends(get_config),
+    ],
+    encoder: auto.typing.Annotated[
+        encode.Encoder,
+        auto.fastapi.Depends(get_encoder),
+    ],
+    budgets: auto.typing.Annotated[
+        fair.RenderBudgets,
+        auto.fastapi.Depends(get_budgets),
+    ],
+):
+    await websocket.accept()
+    client = client_of(websocket)
+    observations = observation_ids(scenes)
+
+    latest = None
+    pending = auto.asyncio.Event()
+    frames = 0
+    coalesced = 0
+
+    async def receive():
+        nonlocal latest, coalesced
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                raise auto.fastapi.WebSocketDisconnect(message.get('code', 1000))
+
+            if latest is not None:
+                # Never rendered; the newer message replaces it
+                coalesced += 1
+            latest = message.get('text') or message.get('bytes') or ''
+            pending.set()
+
+    async def render(request: model.RenderingRequest, priority: str | None):
+        rank = budgets.demote(client, prioritize(request, priority, config))
+        reserved = budgets.reserve(client)
+        start = None
+        try:
+            async with scenes.checkout(rank, request) as scene_:
+                start = auto.time.perf_counter()
+                return await scene_.arender(request, custom_logger)
+
+        finally:
+            if start is None:
+                budgets.refund(client, reserved)
+            else:
+                budgets.charge(client, auto.time.perf_counter() - start, reserved=reserved)
+
+    receiver = auto.asyncio.ensure_future(receive())
+    try:
+        while True:
+            waiter = auto.asyncio.ensure_future(pending.wait())
+            await auto.asyncio.wait([waiter, receiver], return_when=auto.asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                waiter.cancel()
+                receiver.result()
+
+            pending.clear()
+            message, latest = latest, None
+
+            sequence = None
+            try:
+                message = json.loads(message)
+                if not isinstance(message, dict):
+                    raise ValueError('Messages need to be JSON objects')
+
+                sequence = message.pop('sequence', None)
+                format = message.pop('format', 'png')
+                priority = message.pop('priority', None)
+                if format not in encode.MEDIA_TYPES:
+                    raise ValueError(f'Unsupported format: {format!r}')
+                if priority is not None and priority not in pool.PRIORITIES:
+                    raise ValueError(f'Unsupported priority: {priority!r}')
+
+                request = await interactive_request(message, config, observations)
+                if request.dtype != 'uint8' and format != 'raw':
+                    raise ValueError(f'dtype={request.dtype} needs format=raw')
+
+            except (TypeError, ValueError) as e:
+                await websocket.send_json(dict(
+                    sequence=sequence,
+                    error=str(e),
+                ))
+                continue
+
+            # Stop rendering once the client is gone
+            rendering = auto.asyncio.ensure_future(render(request, priority))
+            await auto.asyncio.wait([rendering, receiver], return_when=auto.asyncio.FIRST_COMPLETED)
+            if not rendering.done():
+                rendering.cancel()
+                with auto.contextlib.suppress(auto.asyncio.CancelledError):
+                    await rendering
+                receiver.result()
+
+            try:
+                response = rendering.result()
+
+            except pool.PoolFull:
+                custom_logger.warning(event='render_queue_full', **scenes.stats())
+                await websocket.send_json(dict(
+                    sequence=sequence,
+                    error='Render queue is full',
+                    retry_after=config.renderer.retry_after(),
+                ))
+                continue
+
+            except Exception:
+                custom_logger.exception(event='interactive_render_failed', sequence=sequence)
+                await websocket.send_json(dict(
+                    sequence=sequence,
+                    error='Rendering failed',
+                ))
+                continue
+
+            content = await encoder.aencode(response.pixels, format)
+            frames += 1
+
+            await websocket.send_json(dict(
+                sequence=sequence,
+                media_type=encode.MEDIA_TYPES[format],
+                # JSON has no infinity
+                variance=response.variance if auto.math.isfinite(response.variance) else None,
+                passes=response.passes,
+                coalesced=coalesced,
+            ))
+            await websocket.send_bytes(content)
+
+    except auto.fastapi.WebSocketDisconnect:
+        pass
+
+    finally:
+        receiver.cancel()
+        custom_logger.info(event='interactive_session_closed', frames=frames, coalesced=coalesced)
+
+
+# Counters of the render pool, sessions, tile cache, coalesced renders and
+# frames, encoders, shared assets, and render time per client
+@app.get('/api/v1/stats')
+async def stats(
+    *,
+
+    scenes: auto.typing.Annotated[
+        pool.ScenePool,
+        auto.fastapi.Depends(get_scenes),
+    ],
+    tiles: auto.typing.Annotated[
+        cache.TileCache,
+        auto.fastapi.Depends(get_tiles),
+    ],
+    frames: auto.typing.Annotated[
+        coalesce.FrameCoalescer,
+        auto.fastapi.Depends(get_frames),
+    ],
+    encoder: auto.typing.Annotated[
+        encode.Encoder,
+        auto.fastapi.Depends(get_encoder),
+    ],
+    budgets: auto.typing.Annotated[
+        fair.RenderBudgets,
+        auto.fastapi.Depends(get_budgets),
+    ],
+):
+    return dict(
+        pool=scenes.stats(),
+        sessions=sessions.stats(),
+        cache=tiles.stats(),
+        flights=flights.stats(),
+        frames=frames.stats(),
+        encoding=encoder.stats(),
+        assets=assets.registry.stats(),
+        observations=get_observations().stats(),
+        fairness=budgets.stats(),
+    )
+
+
+# One part of a multipart response
+def multipart_part(boundary: str, content: bytes, media_type: str, headers: dict) -> bytes:
+    lines = [
+        f'--{boundary}',
+        f'Content-Type: {media_type}',
+        f'Content-Length: {len(content)}',
+        *(f'{k}: {v}' for k, v in headers.items()),
+        '',
+        '',
+    ]
+    return '\r\n'.join(lines).encode('utf-8') + content + b'\r\n'
+
 
+# Stream progressively refined images of one view as
+# multipart/x-mixed-replace, which an <img> element displays as it arrives.
+# Without passes or variance, refine up to the configured maximum.
+@app.get('/api/v1/progressive/')
+async def progressive(
+    *,
+
+    scenes: auto.typing.Annotated[
+        pool.ScenePool,
+        auto.fastapi.Depends(get_scenes),
+    ],
+    config: auto.typing.Annotated[
+        auto.typing.Any,
+        auto.fastapi.Depends(get_config),
+    ],
+
+    request: auto.typing.Annotated[
+        model.RenderingRequest,
+        auto.fastapi.Depends(get_rendering_request),
+    ],
+    encoder: auto.typing.Annotated[
+        encode.Encoder,
+        auto.fastapi.Depends(get_encoder),
+    ],
+    format: auto.typing.Annotated[
+        str,
+        auto.fastapi.Depends(get_format),
+    ],
+    priority: auto.typing.Annotated[
+        int,
+        auto.fastapi.Depends(get_priority),
+    ],
+):
+    # Random, so it cannot occur in the (possibly raw) image bytes
+    boundary = auto.secrets.token_hex(16)
+    passes = request.passes or config.renderer.max_passes()
+
+    async def parts():
+        async with checkout(scenes, config, priority, request) as scene_:
+            async for index, variance, response in scene_.aprogressive(request, custom_logger, passes=passes):
+                content = await encoder.aencode(response.pixels, format)
+
+                yield multipart_part(boundary, content, encode.MEDIA_TYPES[format], {
+                    'X-Sunrise-Pass': index + 1,
+                    'X-Sunrise-Variance': variance,
+                })
+
+        yield f'--{boundary}--\r\n'.encode('utf-8')
+
+    # The Scene is checked out, and the first pass rendered, before we
+    # answer, so a full queue is a 503 rather than an empty stream. Once
+    # started, the parts give the Scene back even if nobody reads them.
+    rendering = parts()
+    first = await rendering.__anext__()
+
+    async def stream():
+        yield first
+        async for part in rendering:
+            yield part
+
+    return auto.fastapi.responses.StreamingResponse(
+        stream(),
+        media_type=f'multipart/x-mixed-replace; boundary={boundary}',
+    )
+
+
+# Render every tile of a rows x cols view as a single frame and return the
+# tiles as parts of a multipart/mixed response, or the whole frame as one
+# image (an atlas of the tiles in row-major order)
+@app.get('/api/v1/grid/')
+async def grid(
+    *,
+
+    scenes: auto.typing.Annotated[
+        pool.ScenePool,
+        auto.fastapi.Depends(get_scenes),
+    ],
+    config: auto.typing.Annotated[
+        auto.typing.Any,
+        auto.fastapi.Depends(get_config),
+    ],
+    http_request: auto.fastapi.Request,
+
+    request: auto.typing.Annotated[
+        model.RenderingRequest,
+        auto.fastapi.Depends(get_rendering_request),
+    ],
+
+    rows: auto.typing.Annotated[
+        int,
+        auto.fastapi.Query(
+            alias='rows',
+            ge=1,
+            le=16,
+        ),
+    ],
+    cols: auto.typing.Annotated[
+        int,
+        auto.fastapi.Query(
+            alias='cols',
+            ge=1,
+            le=16,
+        ),
+    ],
+    layout: auto.typing.Annotated[
+        auto.typing.Literal['multipart', 'atlas'],
+        auto.fastapi.Query(
+            alias='layout',
+        ),
+    ] = 'multipart',
+    priority: auto.typing.Annotated[
+        auto.typing.Literal['interactive', 'final', 'animation'] | None,
+        auto.fastapi.Query(
+            alias='priority',
+        ),
+    ] = None,
+    tiles: auto.typing.Annotated[
+        cache.TileCache,
+        auto.fastapi.Depends(get_tiles),
+    ],
+    encoder: auto.typing.Annotated[
+        encode.Encoder,
+        auto.fastapi.Depends(get_encoder),
+    ],
+    format: auto.typing.Annotated[
+        str,
+        auto.fastapi.Depends(get_format),
+    ],
+):
+    request = auto.dataclasses.replace(
+        request,
+        tile=('0of{}'.format(rows), '0of{}'.format(cols)),
+        span=(rows, cols),
+    )
+    # Judged by the whole frame rather than by one of its tiles
+    priority = prioritize(request, priority, config)
+
+    async def render():
+        async with checkout(scenes, config, priority, request) as scene_:
+            return await scene_.arender(request, custom_logger)
+
+    try:
+        response = await session_.cancellable(http_request, flights.do(tiles.key(request), render))
+
+    except session_.Cancelled:
+        return auto.fastapi.Response(status_code=499)
+
+    headers = {
+        'X-Sunrise-Variance': str(response.variance),
+        'X-Sunrise-Passes': str(response.passes),
+    }
+
+    if layout == 'atlas':
         return auto.fastapi.Response(
-            content=f.getvalue(),
-            media_type='image/png',
+            content=await encoder.aencode(response.pixels, format),
+            media_type=encode.MEDIA_TYPES[format],
+            headers=headers,
         )
 
+    # The tiles are encoded concurrently across the encoder processes
+    cells = [(row, col) for row in range(rows) for col in range(cols)]
+    contents = await asyncio.gather(*(
+        encoder.aencode(response.tile(row, col, width=request.width, height=request.height).pixels, format)
+        for row, col in cells
+    ))
+
+    boundary = auto.secrets.token_hex(16)
+    parts = []
+    for (row, col), content in zip(cells, contents):
+        parts.append(multipart_part(boundary, content, encode.MEDIA_TYPES[format], {
+            'X-Sunrise-Tile': f'{row}of{rows},{col}of{cols}',
+        }))
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+
+    return auto.fastapi.Response(
+        content=b''.join(parts),
+        media_type=f'multipart/mixed; boundary={boundary}',
+        headers=headers,
+    )
+
 
 # Run the fastapi server
 async def run_server():
@@ -407,6 +1246,9 @@ async def run_server():
         "sunrise.server:app",
         port=config_info.server.port(),
         host=config_info.server.bind(),
+        # Behind the proxy, clients are told apart by X-Forwarded-For
+        proxy_headers=True,
+        forwarded_allow_ips=config_info.server.proxies(),
     )
     server = auto.uvicorn.Server(config)
     await server.serve()
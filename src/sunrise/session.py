@@ -0,0 +1,136 @@
+"""
+
+"""
+
+from __future__ import annotations
+from ._auto import auto
+
+import asyncio
+import collections
+
+__all__ = [
+    'Cancelled',
+    'Superseded',
+    'Sessions',
+    'cancellable',
+]
+
+
+class Cancelled(Exception):
+    """Raised when a render was abandoned before it finished because the
+    client went away."""
+
+
+class Superseded(Exception):
+    """Raised for a request whose sequence number is older than the newest
+    one already seen for the same session, or whose render was cancelled
+    because a newer one arrived."""
+
+
+class Sessions:
+    """Track in-flight render tasks per client session.
+
+    Every request of a session carries a sequence number. When a request
+    with a newer sequence arrives, the tasks still running for older
+    sequences are cancelled, so a client that moved the camera on does not
+    wait behind tiles it will never draw. The newest sequence of the
+    `sessions` most recently seen sessions is remembered after their tasks
+    finish, so a request that arrives late is still superseded.
+    """
+
+    def __init__(self, *, sessions: int=4096):
+        self.sessions = sessions
+
+        self._latest: collections.OrderedDict[str, int] = collections.OrderedDict()
+        self._tasks: dict[str, set[asyncio.Task]] = {}
+        self.superseded = 0
+
+    def enter(self, session: str, sequence: int, task: asyncio.Task):
+        latest = self._latest.pop(session, sequence)
+        self._latest[session] = max(latest, sequence)
+        while len(self._latest) > self.sessions:
+            self._latest.popitem(last=False)
+
+        if sequence < latest:
+            self.superseded += 1
+            raise Superseded()
+
+        tasks = self._tasks.setdefault(session, set())
+        if sequence > latest:
+            for other in tasks:
+                self.superseded += 1
+                other.cancel()
+            tasks.clear()
+
+        tasks.add(task)
+
+    def exit(self, session: str, sequence: int, task: asyncio.Task):
+        tasks = self._tasks.get(session)
+        if tasks is None:
+            return
+
+        tasks.discard(task)
+        if not tasks:
+            del self._tasks[session]
+
+    def is_superseded(self, session: str, sequence: int) -> bool:
+        return sequence < self._latest.get(session, sequence)
+
+    def stats(self) -> dict:
+        return dict(
+            sessions=len(self._latest),
+            rendering=len(self._tasks),
+            superseded=self.superseded,
+        )
+
+
+async def cancellable(
+    request,
+    coro,
+    /,
+    *,
+    sessions: Sessions | None=None,
+    session: str | None=None,
+    sequence: int=0,
+    interval: float=0.05,
+):
+    """Run coro as a task that is cancelled when the client disconnects or
+    when a newer request of the same session arrives.
+
+    Raises Superseded if a newer request cancelled the task, and Cancelled
+    if it did not run to completion otherwise.
+    """
+    task = auto.asyncio.ensure_future(coro)
+    if sessions is not None and session is not None:
+        try:
+            sessions.enter(session, sequence, task)
+        except Superseded:
+            task.cancel()
+            raise
+
+    async def watch():
+        while not task.done():
+            if await request.is_disconnected():
+                task.cancel()
+                return
+            await auto.asyncio.sleep(interval)
+
+    watcher = auto.asyncio.ensure_future(watch())
+    try:
+        await auto.asyncio.wait([task])
+
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    finally:
+        watcher.cancel()
+        if sessions is not None and session is not None:
+            sessions.exit(session, sequence, task)
+
+    if task.cancelled():
+        if sessions is not None and session is not None and sessions.is_superseded(session, sequence):
+            raise Superseded()
+        raise Cancelled()
+
+    return task.result()
@@ -125,6 +125,10 @@ class Sunrise {
 	this.lowResWidth = (this.highResWidth / 2) |0;
 	this.lowResHeight = (this.highResHeight / 2) |0;
         this.samples = 1;
+        this.session = Math.random().toString(36).slice(2);
+        // Animations ask the server to render their frames after other users' views
+        this.priority = null;
+        this.sequence = 0;
         this.is_dragging = false;
 
         this.loading = false;
@@ -326,6 +330,8 @@ class Sunrise {
 
         let ctx = this.secondary.getContext('2d');
         let promises = [];
+        // Newer frames let the server cancel tiles of older ones
+        const sequence = ++this.sequence;
         const tileWidth = this.canvasWidth / render_data.num_cols;
         const tileHeight = this.canvasHeight / render_data.num_rows;
         for (let i = 0, n = this.definitions.length; i < n; i++) {
@@ -416,6 +422,11 @@ class Sunrise {
             url.searchParams.append('samples', this.samples);
             url.searchParams.append('hour', render_data.hour);
             url.searchParams.append('light', this.light);
+            url.searchParams.append('session', this.session);
+            url.searchParams.append('sequence', sequence);
+            if (this.priority !== null) {
+                url.searchParams.append('priority', this.priority);
+            }
 
             return new Promise((resolve, reject) => {
                 let image = new Image(this.dimension, this.dimension);
@@ -540,6 +551,7 @@ class Sunrise {
         */
     async play_sunrise() {
         this.camera_enabled = false;
+        this.priority = 'animation';
         let step = 0.25;
         let start = new Date().getHours() -5;
         let end = start + 24;
@@ -547,6 +559,7 @@ class Sunrise {
         for (let i = start; i < end; i += step) {
             await this.updateTiles(new RenderData(this.#world_direction(), i, 1, 1, this.highResWidth, this.highResHeight,));
         }
+        this.priority = null;
         this.camera_enabled = true;
     }
 
@@ -566,6 +579,7 @@ class Sunrise {
         // let selector = document.getElementById("path_speed_selector");
         // let display = document.getElementById("ips_display");
         this.current_mission = mission;
+        this.priority = 'animation';
         let ips = 30;
         // let total_remaining_seconds = mission.length() / ips;
         let total_remaining_seconds = mission.remaining_length() / ips;
@@ -598,6 +612,7 @@ class Sunrise {
             render_data = mission.forward(offset);
         }
         this.dimension = this.highres;
+        this.priority = null;
         this.camera_enabled = true;
     }
 
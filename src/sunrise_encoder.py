@@ -0,0 +1,131 @@
+"""
+Image encoding for the sunrise server, including its raw pixel format.
+
+This module runs in the encoder processes, which are spawned rather than
+forked, so it lives outside the sunrise package: importing anything from
+the package would load OSPRay, skyfield and the scene code into every
+encoder. Keep it to the standard library, numpy and Pillow.
+"""
+
+from __future__ import annotations
+
+import io
+import multiprocessing.shared_memory
+import struct
+import zlib
+
+import numpy as np
+import PIL.Image
+
+__all__ = [
+    'MEDIA_TYPE',
+    'HEADER',
+    'pack',
+    'unpack',
+    'encode',
+    'encode_shared',
+]
+
+
+MEDIA_TYPE = 'application/x-sunrise-raw'
+
+# magic, version, flags, width, height, channels, dtype; little endian
+HEADER = struct.Struct('<4sHHIIHH')
+MAGIC = b'SRAW'
+VERSION = 1
+
+ZLIB = 1 << 0
+
+DTYPES = {
+    1: np.dtype('u1'),
+    2: np.dtype('<f4'),
+}
+
+
+def pack(pixels: np.ndarray, /, *, level: int | None=None) -> bytes:
+    """Prefix (height, width, channels) pixels with a header, compressing
+    the pixel bytes with zlib at `level` if one is given."""
+    height, width, channels = pixels.shape
+    (code ,) = [code for code, dtype in DTYPES.items() if dtype == pixels.dtype]
+
+    flags = 0
+    content = np.ascontiguousarray(pixels).data
+    if level is not None:
+        flags |= ZLIB
+        content = zlib.compress(content, level)
+
+    return b''.join([
+        HEADER.pack(MAGIC, VERSION, flags, width, height, channels, code),
+        content,
+    ])
+
+
+def unpack(data: bytes, /) -> np.ndarray:
+    """The (height, width, channels) pixels of a packed response; without
+    compression the array is a view of `data`."""
+    magic, version, flags, width, height, channels, code = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'Not a raw response: {magic!r} version {version}')
+
+    content = memoryview(data)[HEADER.size:]
+    if flags & ZLIB:
+        content = zlib.decompress(content)
+
+    return np.frombuffer(content, dtype=DTYPES[code]).reshape(height, width, channels)
+
+
+def encode(
+    pixels: np.ndarray,
+    format: str,
+    /,
+    *,
+    png_level: int,
+    png_alpha: bool,
+    jpeg_quality: int,
+    webp_quality: int,
+    webp_lossless: bool,
+    raw_level: int,
+    compress: bool=False,
+) -> bytes:
+    if format == 'raw':
+        return pack(pixels, level=raw_level if compress else None)
+
+    if format != 'png' or not png_alpha:
+        pixels = pixels[..., :3]
+    image = PIL.Image.fromarray(np.ascontiguousarray(pixels))
+
+    with io.BytesIO() as f:
+        if format == 'png':
+            image.save(f, 'PNG', compress_level=png_level)
+        elif format == 'jpeg':
+            image.save(f, 'JPEG', quality=jpeg_quality)
+        elif format == 'webp':
+            image.save(f, 'WEBP', quality=webp_quality, lossless=webp_lossless)
+        else:
+            raise ValueError(f'Unsupported format: {format!r}')
+        return f.getvalue()
+
+
+# Runs in an encoder process: encode pixels the parent left in shared
+# memory, `offset` bytes into the segment and laid out with `strides`
+def encode_shared(
+    name: str,
+    offset: int,
+    shape: tuple[int, ...],
+    strides: tuple[int, ...],
+    dtype: str,
+    format: str,
+    settings: dict,
+    compress: bool,
+) -> bytes:
+    # Attaching registers the segment with the resource tracker we share
+    # with the parent, which already tracks it; the parent unlinks it
+    memory = multiprocessing.shared_memory.SharedMemory(name=name)
+    pixels = None
+    try:
+        pixels = np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset, strides=strides)
+        return encode(pixels, format, compress=compress, **settings)
+
+    finally:
+        del pixels
+        memory.close()